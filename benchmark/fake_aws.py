@@ -0,0 +1,382 @@
+import collections
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from botocore.exceptions import ClientError
+
+class FakeOrganization:
+    def __init__(self, account_count=100, permission_set_count=20, user_count=1000, group_count=100,
+                 permission_sets_per_account=4, principals_per_assignment=3, group_assignment_ratio=0.3,
+                 suspended_account_ratio=0.02, members_per_group=10, organizational_unit_count=10, seed=0):
+        """Synthetic AWS organization with an Identity Center instance, shared by the fake clients
+
+        Example:
+            organization = FakeOrganization(account_count=5000, permission_set_count=500, user_count=45000, group_count=5000)
+            sso_admin_client = FakeSsoAdminClient(organization, latency_seconds=0.05)
+        """
+        randomizer = random.Random(seed)
+        created_date = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        self.instance = {
+            'InstanceArn': 'arn:aws:sso:::instance/ssoins-0000000000000000',
+            'IdentityStoreId': 'd-0000000000'
+        }
+        self.accounts = [{
+            'Id': f'{100000000000 + account_index}',
+            'Arn': f'arn:aws:organizations::000000000000:account/o-fake/{100000000000 + account_index}',
+            'Email': f'account-{account_index:05d}@example.com',
+            'Name': f'account-{account_index:05d}',
+            'Status': 'SUSPENDED' if randomizer.random() < suspended_account_ratio else 'ACTIVE',
+            'JoinedMethod': 'CREATED',
+            'JoinedTimestamp': created_date + timedelta(days=account_index % 1000)
+        } for account_index in range(account_count)]
+        self.permission_sets = {
+            f'arn:aws:sso:::permissionSet/ssoins-0000000000000000/ps-{permission_set_index:016x}': {
+                'Name': f'PermissionSet{permission_set_index:04d}',
+                'PermissionSetArn': f'arn:aws:sso:::permissionSet/ssoins-0000000000000000/ps-{permission_set_index:016x}',
+                'Description': f'Synthetic permission set {permission_set_index}',
+                'CreatedDate': created_date + timedelta(hours=permission_set_index),
+                'SessionDuration': 'PT1H'
+            } for permission_set_index in range(permission_set_count)
+        }
+        self.users = {
+            f'{user_index:08x}-0000-4000-8000-{seed:012x}': f'user{user_index:06d}'
+            for user_index in range(user_count)
+        }
+        self.groups = {
+            f'{group_index:08x}-0000-4000-9000-{seed:012x}': f'group{group_index:05d}'
+            for group_index in range(group_count)
+        }
+        self.user_records = [
+            {'UserId': user_id, 'UserName': username, 'IdentityStoreId': self.instance['IdentityStoreId']}
+            for user_id, username in self.users.items()
+        ]
+        self.group_records = [
+            {'GroupId': group_id, 'DisplayName': groupname, 'IdentityStoreId': self.instance['IdentityStoreId']}
+            for group_id, groupname in self.groups.items()
+        ]
+        permission_set_arns = list(self.permission_sets)
+        user_ids = list(self.users)
+        group_ids = list(self.groups)
+        membership_randomizer = random.Random(seed + 1)
+        self.group_memberships = {
+            group_id: membership_randomizer.sample(user_ids, min(members_per_group, len(user_ids)))
+            for group_id in group_ids
+        }
+        self.account_assignments = {}
+        account_ids_by_permission_set = collections.defaultdict(list)
+        for account in self.accounts:
+            for permission_set_arn in randomizer.sample(permission_set_arns, min(permission_sets_per_account, len(permission_set_arns))):
+                principals = {}
+                for _ in range(principals_per_assignment):
+                    if group_ids and (not user_ids or randomizer.random() < group_assignment_ratio):
+                        principals[randomizer.choice(group_ids)] = 'GROUP'
+                    elif user_ids:
+                        principals[randomizer.choice(user_ids)] = 'USER'
+                self.account_assignments[(account['Id'], permission_set_arn)] = [{
+                    'AccountId': account['Id'],
+                    'PermissionSetArn': permission_set_arn,
+                    'PrincipalType': principal_type,
+                    'PrincipalId': principal_id
+                } for principal_id, principal_type in principals.items()]
+                account_ids_by_permission_set[permission_set_arn].append(account['Id'])
+        self.account_ids_by_permission_set = {
+            permission_set_arn: account_ids_by_permission_set.get(permission_set_arn, [])
+            for permission_set_arn in permission_set_arns
+        }
+        self.assignment_requests = []
+        # Half of the organizational units are children of the root, the other half nested one level deeper
+        self.root_id = 'r-fake'
+        top_level_count = (organizational_unit_count + 1) // 2
+        self.parent_ids_by_organizational_unit = {
+            f'ou-fake-{ou_index:08d}': self.root_id if ou_index < top_level_count else f'ou-fake-{ou_index - top_level_count:08d}'
+            for ou_index in range(organizational_unit_count)
+        }
+        parent_ids = [self.root_id, *self.parent_ids_by_organizational_unit]
+        self.parent_ids_by_account = {
+            account['Id']: parent_ids[account_index % len(parent_ids)]
+            for account_index, account in enumerate(self.accounts)
+        }
+        self.account_tags = {
+            account['Id']: [
+                {'Key': 'BusinessUnit', 'Value': f'bu-{account_index % 5}'},
+                {'Key': 'Environment', 'Value': 'prod' if account_index % 2 else 'dev'}
+            ] for account_index, account in enumerate(self.accounts)
+        }
+
+    def get_assignment_count(self):
+        return sum(len(account_assignments) for account_assignments in self.account_assignments.values())
+
+class FakeAwsClient:
+    THROTTLING_ERROR_CODE = 'ThrottlingException'
+    DEFAULT_PAGE_SIZES = {}
+
+    def __init__(self, organization: FakeOrganization, latency_seconds=0.0, page_sizes=None,
+                 throttle_quotas=None, throttle_probability=0.0, seed=0):
+        """In-process stand-in for a boto3 client
+
+        latency_seconds: Sleep of every call
+        page_sizes: Maximum page size per operation, e.g. {'ListAccountAssignments': 10}
+        throttle_quotas: Calls per second per operation before a throttling error is raised, e.g. {'DescribeUser': 20}
+        throttle_probability: Probability of a throttling error independent of the quota
+        """
+        self.organization = organization
+        self.latency_seconds = latency_seconds
+        self.page_sizes = {**self.DEFAULT_PAGE_SIZES, **(page_sizes or {})}
+        self.throttle_quotas = throttle_quotas or {}
+        self.throttle_probability = throttle_probability
+        self.call_counts = collections.Counter()
+        self.throttle_counts = collections.Counter()
+        self._randomizer = random.Random(seed)
+        self._call_windows = {}
+        self._lock = threading.Lock()
+
+    def _call(self, operation_name: str):
+        with self._lock:
+            self.call_counts[operation_name] += 1
+            now = time.monotonic()
+            window_start, window_calls = self._call_windows.get(operation_name, (now, 0))
+            if now - window_start >= 1.0:
+                window_start, window_calls = now, 0
+            window_calls += 1
+            self._call_windows[operation_name] = (window_start, window_calls)
+            throttled = (window_calls > self.throttle_quotas.get(operation_name, float('inf'))
+                         or self._randomizer.random() < self.throttle_probability)
+            if throttled:
+                self.throttle_counts[operation_name] += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if throttled:
+            raise ClientError({'Error': {'Code': self.THROTTLING_ERROR_CODE, 'Message': 'Rate exceeded'}}, operation_name)
+
+    def _not_found(self, operation_name: str, message: str):
+        raise ClientError({'Error': {'Code': 'ResourceNotFoundException', 'Message': message}}, operation_name)
+
+    def _page(self, operation_name: str, items: list, items_key: str, MaxResults=None, NextToken=None):
+        page_size = min(MaxResults or self.page_sizes.get(operation_name, 100), self.page_sizes.get(operation_name, 100))
+        start = int(NextToken or 0)
+        page = {items_key: items[start:start + page_size]}
+        if start + page_size < len(items):
+            page['NextToken'] = str(start + page_size)
+        return page
+
+    def get_paginator(self, method_name: str):
+        return FakePaginator(getattr(self, method_name))
+
+class FakePaginator:
+    def __init__(self, method):
+        self._method = method
+
+    def paginate(self, **kwargs):
+        page = self._method(**kwargs)
+        yield page
+        while page.get('NextToken', False):
+            page = self._method(**kwargs, NextToken=page['NextToken'])
+            yield page
+
+class FakeSsoAdminClient(FakeAwsClient):
+    DEFAULT_PAGE_SIZES = {
+        'ListPermissionSets': 100,
+        'ListAccountsForProvisionedPermissionSet': 100,
+        'ListAccountAssignments': 100,
+        'ListAccountAssignmentsForPrincipal': 100,
+        'ListAccountAssignmentCreationStatus': 100,
+        'ListAccountAssignmentDeletionStatus': 100
+    }
+
+    def list_instances(self, **kwargs):
+        self._call('ListInstances')
+        return {'Instances': [dict(self.organization.instance)]}
+
+    def list_permission_sets(self, InstanceArn, MaxResults=None, NextToken=None):
+        self._call('ListPermissionSets')
+        return self._page('ListPermissionSets', list(self.organization.permission_sets), 'PermissionSets', MaxResults, NextToken)
+
+    def describe_permission_set(self, InstanceArn, PermissionSetArn):
+        self._call('DescribePermissionSet')
+        if PermissionSetArn not in self.organization.permission_sets:
+            self._not_found('DescribePermissionSet', f'PermissionSet {PermissionSetArn} not found')
+        return {'PermissionSet': dict(self.organization.permission_sets[PermissionSetArn])}
+
+    def list_accounts_for_provisioned_permission_set(self, InstanceArn, PermissionSetArn, MaxResults=None, NextToken=None, ProvisioningStatus=None):
+        self._call('ListAccountsForProvisionedPermissionSet')
+        account_ids = self.organization.account_ids_by_permission_set.get(PermissionSetArn, [])
+        return self._page('ListAccountsForProvisionedPermissionSet', account_ids, 'AccountIds', MaxResults, NextToken)
+
+    def list_permission_sets_provisioned_to_account(self, InstanceArn, AccountId, MaxResults=None, NextToken=None, ProvisioningStatus=None):
+        self._call('ListPermissionSetsProvisionedToAccount')
+        permission_set_arns = [permission_set_arn for account_id, permission_set_arn in self.organization.account_assignments if account_id == AccountId]
+        return self._page('ListPermissionSetsProvisionedToAccount', permission_set_arns, 'PermissionSets', MaxResults, NextToken)
+
+    def list_account_assignments(self, InstanceArn, AccountId, PermissionSetArn, MaxResults=None, NextToken=None):
+        self._call('ListAccountAssignments')
+        account_assignments = self.organization.account_assignments.get((AccountId, PermissionSetArn), [])
+        return self._page('ListAccountAssignments', account_assignments, 'AccountAssignments', MaxResults, NextToken)
+
+    def list_account_assignments_for_principal(self, InstanceArn, PrincipalId, PrincipalType, MaxResults=None, NextToken=None, Filter=None):
+        self._call('ListAccountAssignmentsForPrincipal')
+        principal_assignments = [
+            account_assignment
+            for (account_id, _), account_assignments in self.organization.account_assignments.items()
+            if not (Filter or {}).get('AccountId') or account_id == Filter['AccountId']
+            for account_assignment in account_assignments
+            if account_assignment['PrincipalId'] == PrincipalId and account_assignment['PrincipalType'] == PrincipalType
+        ]
+        return self._page('ListAccountAssignmentsForPrincipal', principal_assignments, 'AccountAssignments', MaxResults, NextToken)
+
+    def list_account_assignment_creation_status(self, InstanceArn, MaxResults=None, NextToken=None, Filter=None):
+        self._call('ListAccountAssignmentCreationStatus')
+        request_statuses = [
+            {'Status': request['Status'], 'RequestId': request['RequestId'], 'CreatedDate': request['CreatedDate']}
+            for request in self.organization.assignment_requests if request['RequestType'] == 'CREATE'
+        ]
+        return self._page('ListAccountAssignmentCreationStatus', request_statuses, 'AccountAssignmentsCreationStatus', MaxResults, NextToken)
+
+    def list_account_assignment_deletion_status(self, InstanceArn, MaxResults=None, NextToken=None, Filter=None):
+        self._call('ListAccountAssignmentDeletionStatus')
+        request_statuses = [
+            {'Status': request['Status'], 'RequestId': request['RequestId'], 'CreatedDate': request['CreatedDate']}
+            for request in self.organization.assignment_requests if request['RequestType'] == 'DELETE'
+        ]
+        return self._page('ListAccountAssignmentDeletionStatus', request_statuses, 'AccountAssignmentsDeletionStatus', MaxResults, NextToken)
+
+    def describe_account_assignment_creation_status(self, InstanceArn, AccountAssignmentCreationRequestId):
+        self._call('DescribeAccountAssignmentCreationStatus')
+        return {'AccountAssignmentCreationStatus': self._get_assignment_request('DescribeAccountAssignmentCreationStatus', AccountAssignmentCreationRequestId)}
+
+    def describe_account_assignment_deletion_status(self, InstanceArn, AccountAssignmentDeletionRequestId):
+        self._call('DescribeAccountAssignmentDeletionStatus')
+        return {'AccountAssignmentDeletionStatus': self._get_assignment_request('DescribeAccountAssignmentDeletionStatus', AccountAssignmentDeletionRequestId)}
+
+    def _get_assignment_request(self, operation_name: str, request_id: str):
+        request = next((request for request in self.organization.assignment_requests if request['RequestId'] == request_id), None)
+        if request is None:
+            self._not_found(operation_name, f'Request {request_id} not found')
+        return {key: value for key, value in request.items() if key != 'RequestType'}
+
+    def create_account_assignment(self, InstanceArn, TargetId, TargetType, PermissionSetArn, PrincipalType, PrincipalId):
+        """Assigns a principal and records the request, like the real API does for the assignment request history"""
+        self._call('CreateAccountAssignment')
+        account_assignments = self.organization.account_assignments.setdefault((TargetId, PermissionSetArn), [])
+        if not any(account_assignment['PrincipalId'] == PrincipalId for account_assignment in account_assignments):
+            account_assignments.append({
+                'AccountId': TargetId,
+                'PermissionSetArn': PermissionSetArn,
+                'PrincipalType': PrincipalType,
+                'PrincipalId': PrincipalId
+            })
+        if TargetId not in self.organization.account_ids_by_permission_set.setdefault(PermissionSetArn, []):
+            self.organization.account_ids_by_permission_set[PermissionSetArn].append(TargetId)
+        return {'AccountAssignmentCreationStatus': self._record_assignment_request('CREATE', TargetId, PermissionSetArn, PrincipalType, PrincipalId)}
+
+    def delete_account_assignment(self, InstanceArn, TargetId, TargetType, PermissionSetArn, PrincipalType, PrincipalId):
+        self._call('DeleteAccountAssignment')
+        account_assignments = self.organization.account_assignments.get((TargetId, PermissionSetArn), [])
+        account_assignments[:] = [account_assignment for account_assignment in account_assignments if account_assignment['PrincipalId'] != PrincipalId]
+        return {'AccountAssignmentDeletionStatus': self._record_assignment_request('DELETE', TargetId, PermissionSetArn, PrincipalType, PrincipalId)}
+
+    def _record_assignment_request(self, request_type, target_id, permission_set_arn, principal_type, principal_id):
+        request = {
+            'RequestType': request_type,
+            'Status': 'SUCCEEDED',
+            'RequestId': f'{len(self.organization.assignment_requests):08x}-0000-4000-a000-000000000000',
+            'TargetId': target_id,
+            'TargetType': 'AWS_ACCOUNT',
+            'PermissionSetArn': permission_set_arn,
+            'PrincipalType': principal_type,
+            'PrincipalId': principal_id,
+            'CreatedDate': datetime.now(timezone.utc)
+        }
+        self.organization.assignment_requests.append(request)
+        return {key: value for key, value in request.items() if key != 'RequestType'}
+
+class FakeIdentitystoreClient(FakeAwsClient):
+    DEFAULT_PAGE_SIZES = {
+        'ListUsers': 100,
+        'ListGroups': 100,
+        'ListGroupMemberships': 100
+    }
+
+    def describe_user(self, IdentityStoreId, UserId):
+        self._call('DescribeUser')
+        if UserId not in self.organization.users:
+            self._not_found('DescribeUser', f'User {UserId} not found')
+        return {'UserId': UserId, 'UserName': self.organization.users[UserId], 'IdentityStoreId': IdentityStoreId}
+
+    def describe_group(self, IdentityStoreId, GroupId):
+        self._call('DescribeGroup')
+        if GroupId not in self.organization.groups:
+            self._not_found('DescribeGroup', f'Group {GroupId} not found')
+        return {'GroupId': GroupId, 'DisplayName': self.organization.groups[GroupId], 'IdentityStoreId': IdentityStoreId}
+
+    def get_user_id(self, IdentityStoreId, AlternateIdentifier):
+        self._call('GetUserId')
+        username = AlternateIdentifier['UniqueAttribute']['AttributeValue']
+        user_id = next((user_id for user_id, known_username in self.organization.users.items() if known_username == username), None)
+        if user_id is None:
+            self._not_found('GetUserId', f'User {username} not found')
+        return {'UserId': user_id, 'IdentityStoreId': IdentityStoreId}
+
+    def get_group_id(self, IdentityStoreId, AlternateIdentifier):
+        self._call('GetGroupId')
+        groupname = AlternateIdentifier['UniqueAttribute']['AttributeValue']
+        group_id = next((group_id for group_id, known_groupname in self.organization.groups.items() if known_groupname == groupname), None)
+        if group_id is None:
+            self._not_found('GetGroupId', f'Group {groupname} not found')
+        return {'GroupId': group_id, 'IdentityStoreId': IdentityStoreId}
+
+    def list_users(self, IdentityStoreId, MaxResults=None, NextToken=None, Filters=None):
+        self._call('ListUsers')
+        return self._page('ListUsers', self.organization.user_records, 'Users', MaxResults, NextToken)
+
+    def list_groups(self, IdentityStoreId, MaxResults=None, NextToken=None, Filters=None):
+        self._call('ListGroups')
+        return self._page('ListGroups', self.organization.group_records, 'Groups', MaxResults, NextToken)
+
+    def list_group_memberships(self, IdentityStoreId, GroupId, MaxResults=None, NextToken=None):
+        self._call('ListGroupMemberships')
+        if GroupId not in self.organization.groups:
+            self._not_found('ListGroupMemberships', f'Group {GroupId} not found')
+        group_memberships = [{
+            'IdentityStoreId': IdentityStoreId,
+            'MembershipId': f'{GroupId}/{user_id}',
+            'GroupId': GroupId,
+            'MemberId': {'UserId': user_id}
+        } for user_id in self.organization.group_memberships[GroupId]]
+        return self._page('ListGroupMemberships', group_memberships, 'GroupMemberships', MaxResults, NextToken)
+
+class FakeOrganizationsClient(FakeAwsClient):
+    THROTTLING_ERROR_CODE = 'TooManyRequestsException'
+    DEFAULT_PAGE_SIZES = {
+        'ListAccounts': 20,
+        'ListAccountsForParent': 20,
+        'ListChildren': 20
+    }
+
+    def list_accounts(self, MaxResults=None, NextToken=None):
+        self._call('ListAccounts')
+        return self._page('ListAccounts', self.organization.accounts, 'Accounts', MaxResults, NextToken)
+
+    def describe_account(self, AccountId):
+        self._call('DescribeAccount')
+        for account in self.organization.accounts:
+            if account['Id'] == AccountId:
+                return {'Account': account}
+        raise ClientError({'Error': {'Code': 'AccountNotFoundException', 'Message': f'Account {AccountId} not found'}}, 'DescribeAccount')
+
+    def list_accounts_for_parent(self, ParentId, MaxResults=None, NextToken=None):
+        self._call('ListAccountsForParent')
+        accounts = [account for account in self.organization.accounts if self.organization.parent_ids_by_account[account['Id']] == ParentId]
+        return self._page('ListAccountsForParent', accounts, 'Accounts', MaxResults, NextToken)
+
+    def list_children(self, ParentId, ChildType, MaxResults=None, NextToken=None):
+        self._call('ListChildren')
+        if ChildType == 'ACCOUNT':
+            children = [{'Id': account_id, 'Type': 'ACCOUNT'} for account_id, parent_id in self.organization.parent_ids_by_account.items() if parent_id == ParentId]
+        else:
+            children = [{'Id': ou_id, 'Type': 'ORGANIZATIONAL_UNIT'} for ou_id, parent_id in self.organization.parent_ids_by_organizational_unit.items() if parent_id == ParentId]
+        return self._page('ListChildren', children, 'Children', MaxResults, NextToken)
+
+    def list_tags_for_resource(self, ResourceId, NextToken=None):
+        self._call('ListTagsForResource')
+        return self._page('ListTagsForResource', self.organization.account_tags.get(ResourceId, []), 'Tags', None, NextToken)
@@ -0,0 +1,160 @@
+import argparse
+import json
+import time
+import tracemalloc
+from benchmark.fake_aws import FakeOrganization, FakeSsoAdminClient, FakeIdentitystoreClient, FakeOrganizationsClient
+from repository.ssoadmin_repository import SsoAdminRepository
+from repository.account_repository import AccountRepository
+from repository.rate_limiter import RateLimiter
+
+ORGANIZATION_SIZES = {
+    'small': {'account_count': 100, 'permission_set_count': 20, 'user_count': 900, 'group_count': 100},
+    'medium': {'account_count': 1000, 'permission_set_count': 100, 'user_count': 9000, 'group_count': 1000},
+    'large': {'account_count': 5000, 'permission_set_count': 500, 'user_count': 45000, 'group_count': 5000}
+}
+
+def crawl(mode, ssoadmin_repository, account_repository, workers, principal_type):
+    """Runs a get_users.py style crawl and returns the number of resolved bindings and the retained result"""
+    accounts = account_repository.get_all_accounts()
+    if mode == 'serial':
+        account_bindings = {account['Id']: ssoadmin_repository.get_bindings_by_account_id(account['Id'], principal_type) for account in accounts}
+        return sum(
+            len(account_binding['attached_users'])
+            for account_bindings_of_account in account_bindings.values()
+            for account_binding in account_bindings_of_account
+        ), account_bindings
+    if mode == 'parallel':
+        account_bindings = ssoadmin_repository.get_bindings_for_accounts(
+            [account['Id'] for account in accounts],
+            max_workers=workers,
+            principal_type=principal_type
+        )
+        return sum(
+            len(account_binding['attached_users'])
+            for account_bindings_of_account in account_bindings.values()
+            for account_binding in account_bindings_of_account
+        ), account_bindings
+    if mode == 'stream':
+        return sum(1 for _ in ssoadmin_repository.iter_bindings(accounts, principal_type=principal_type, max_workers=workers)), None
+    if mode == 'graph':
+        assignment_graph = ssoadmin_repository.build_assignment_graph(accounts, principal_type=principal_type, max_workers=workers)
+        return len(assignment_graph), assignment_graph
+    raise ValueError(f'mode must be one of "serial", "parallel", "stream" or "graph". Provided value {mode}')
+
+def run_benchmark(size, mode='parallel', workers=10, principal_type='USER', latency_seconds=0.0,
+                  page_sizes=None, throttle_quotas=None, throttle_probability=0.0, rate=1000.0, seed=0):
+    """Crawls a synthetic organization end to end against the fake clients
+
+    Returns
+    -------
+    result : dict
+      {
+        'size': 'string',
+        'mode': 'string',
+        'accounts': int,
+        'permission_sets': int,
+        'principals': int,
+        'assignments': int,
+        'bindings': int,
+        'wall_seconds': float,
+        'peak_memory_bytes': int,
+        'result_memory_bytes': int,
+        'api_calls': {'string': int},
+        'throttled_calls': {'string': int}
+      }
+    """
+    organization = FakeOrganization(**ORGANIZATION_SIZES[size], seed=seed)
+    fake_client_settings = {
+        'latency_seconds': latency_seconds,
+        'page_sizes': page_sizes,
+        'throttle_quotas': throttle_quotas,
+        'throttle_probability': throttle_probability,
+        'seed': seed
+    }
+    fake_clients = [
+        FakeSsoAdminClient(organization, **fake_client_settings),
+        FakeIdentitystoreClient(organization, **fake_client_settings),
+        FakeOrganizationsClient(organization, **fake_client_settings)
+    ]
+    sso_admin_client, identitystore_client, organizations_client = fake_clients
+
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    rate_limiter = RateLimiter(default_rate=rate, max_rate=max(rate, RateLimiter().max_rate))
+    ssoadmin_repository = SsoAdminRepository(
+        sso_admin_client,
+        identitystore_client,
+        rate_limiter=rate_limiter
+    )
+    account_repository = AccountRepository(organizations_client, rate_limiter=rate_limiter)
+    binding_count, crawl_result = crawl(mode, ssoadmin_repository, account_repository, workers, principal_type)
+    wall_seconds = time.perf_counter() - started_at
+    _, peak_memory_bytes = tracemalloc.get_traced_memory()
+    # The principal name caches stay alive with the repository, only the crawl result itself is dropped
+    memory_with_result_bytes, _ = tracemalloc.get_traced_memory()
+    del crawl_result
+    memory_without_result_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    api_calls = sum((fake_client.call_counts for fake_client in fake_clients), start=type(sso_admin_client.call_counts)())
+    throttled_calls = sum((fake_client.throttle_counts for fake_client in fake_clients), start=type(sso_admin_client.throttle_counts)())
+    return {
+        'size': size,
+        'mode': mode,
+        'accounts': len(organization.accounts),
+        'permission_sets': len(organization.permission_sets),
+        'principals': len(organization.users) + len(organization.groups),
+        'assignments': organization.get_assignment_count(),
+        'bindings': binding_count,
+        'wall_seconds': round(wall_seconds, 3),
+        'peak_memory_bytes': peak_memory_bytes,
+        'result_memory_bytes': memory_with_result_bytes - memory_without_result_bytes,
+        'api_calls': dict(api_calls),
+        'throttled_calls': dict(throttled_calls)
+    }
+
+def format_result(result):
+    api_calls = ', '.join(f'{operation_name}={calls}' for operation_name, calls in sorted(result['api_calls'].items()))
+    return (f"{result['size']:>6} {result['mode']:>8} accounts={result['accounts']} permission_sets={result['permission_sets']} "
+            f"principals={result['principals']} bindings={result['bindings']} wall={result['wall_seconds']}s "
+            f"peak_memory={result['peak_memory_bytes'] / 2**20:.1f}MiB result_memory={result['result_memory_bytes'] / 2**20:.1f}MiB api_calls={sum(result['api_calls'].values())} ({api_calls})")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmarks the assignment crawl against a synthetic in-process organization')
+    parser.add_argument('--sizes', nargs='+', choices=list(ORGANIZATION_SIZES), default=['small', 'medium'],
+                        help='Organization sizes to crawl, in order. Defaults to small medium')
+    parser.add_argument('--mode', choices=['serial', 'parallel', 'stream', 'graph'], default='parallel')
+    parser.add_argument('--workers', type=int, default=10)
+    parser.add_argument('--principal-type', choices=['USER', 'GROUP', 'ALL'], default='USER')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds every fake API call sleeps')
+    parser.add_argument('--page-size', metavar='OPERATION=SIZE', action='append', default=[],
+                        help='Maximum page size of an operation, e.g. ListAccountAssignments=10. Can be repeated')
+    parser.add_argument('--throttle-quota', metavar='OPERATION=CALLS', action='append', default=[],
+                        help='Calls per second of an operation before the fake throttles, e.g. DescribeUser=20. Can be repeated')
+    parser.add_argument('--throttle-probability', type=float, default=0.0)
+    parser.add_argument('--rate', type=float, default=1000.0, help='Initial client side rate per operation')
+    parser.add_argument('--json', action='store_true', help='Prints one JSON object per size instead of a summary line')
+    return parser.parse_args()
+
+def parse_operation_values(operation_value_arguments):
+    operation_values = {}
+    for operation_value_argument in operation_value_arguments:
+        operation_name, _, value = operation_value_argument.partition('=')
+        operation_values[operation_name] = int(value)
+    return operation_values
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    for size in arguments.sizes:
+        result = run_benchmark(
+            size,
+            mode=arguments.mode,
+            workers=arguments.workers,
+            principal_type=arguments.principal_type,
+            latency_seconds=arguments.latency,
+            page_sizes=parse_operation_values(arguments.page_size),
+            throttle_quotas=parse_operation_values(arguments.throttle_quota),
+            throttle_probability=arguments.throttle_probability,
+            rate=arguments.rate
+        )
+        print(json.dumps(result) if arguments.json else format_result(result), flush=True)
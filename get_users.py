@@ -1,51 +1,466 @@
-import boto3
+import argparse
 import botocore
 import itertools
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
 from repository.ssoadmin_repository import SsoAdminRepository
 from repository.account_repository import AccountRepository
+from repository.snapshot_repository import SnapshotRepository
+from repository.checkpoint_journal import CheckpointJournal
+from repository.rate_limiter import RateLimiter
+from repository.client_factory import ClientFactory
+from repository.metrics import Metrics
+from writers import BINARY_FORMATS, RECORD_WRITERS
+from sharding import merge_partial_results, parse_shard, shard_accounts, write_partial_result
+from service import AssignmentService, serve
 import logging
 
 PROFILE='fancyprofile'
-boto3_session = boto3.session.Session(profile_name=PROFILE)
 
-if __name__ == '__main__':
-    logging.basicConfig(level=logging.WARNING)
-    sso_admin_client = boto3_session.client('sso-admin')
-    organizations_client = boto3_session.client('organizations')
-    identitystore_client = boto3_session.client('identitystore')
-    
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Retrieve the AWS Identity Center account assignments of your organization')
+    parser.add_argument('--profile', default=PROFILE,
+                        help=f'AWS profile of the clients. Defaults to {PROFILE}')
+    parser.add_argument('--region',
+                        help='AWS region of the clients. Defaults to the region of the profile')
+    parser.add_argument('--connect-timeout', type=int, default=5,
+                        help='Seconds to establish a connection. Defaults to 5')
+    parser.add_argument('--read-timeout', type=int, default=30,
+                        help='Seconds to wait for a response. Defaults to 30')
+    parser.add_argument('--retry-mode', choices=['standard', 'adaptive', 'legacy'], default='standard',
+                        help='botocore retry mode, only used with --max-attempts above 1. Defaults to standard')
+    parser.add_argument('--max-attempts', type=int, default=1,
+                        help='botocore attempts per call, throttling retries included. Defaults to 1, which leaves retrying '
+                             'throttled and transiently failed calls to the client side rate limiter')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of parallel ssoadmin:ListAccountAssignments crawls. Defaults to 1')
+    parser.add_argument('--snapshot', metavar='PATH',
+                        help='SQLite file used as local snapshot of accounts, permissionsets, assignments and principal names')
+    parser.add_argument('--snapshot-ttl', metavar='ENTITY=SECONDS', action='append', default=[],
+                        help=f'Overrides the snapshot TTL of an entity type ({", ".join(SnapshotRepository.DEFAULT_TTLS)}). Can be repeated')
+    parser.add_argument('--skip-permissionset-descriptions', action='store_true',
+                        help='Only keeps name and ARN of every permissionset, also in --incremental state files')
+    parser.add_argument('--principal-count', metavar='TYPE=COUNT', action='append', default=[],
+                        help='Known number of USER or GROUP principals of the identitystore, weighs a bulk load of their names against on-demand lookups. Can be repeated')
+    parser.add_argument('--max-cached-principals', type=int, metavar='N',
+                        help='Keeps at most N user names, group names and group memberships each, least recently used first out. Defaults to no limit')
+    parser.add_argument('--format', choices=['repr', *RECORD_WRITERS], default='repr',
+                        help='repr prints one Python dict per account after the crawl, ndjson and csv stream one record per binding, '
+                             'parquet and arrow write the records as columnar file to --output. Defaults to repr')
+    parser.add_argument('--principal-type', choices=['USER', 'GROUP', 'ALL'], default='USER',
+                        help='Reports user, group or all bindings. ALL exports users and groups in a single crawl. Defaults to USER')
+    parser.add_argument('--output', metavar='PATH',
+                        help='Writes the result to PATH instead of stdout')
+    principal_query = parser.add_mutually_exclusive_group()
+    principal_query.add_argument('--user', metavar='USERNAME',
+                                 help='Only reports the accounts and permissionsets of a single user, without crawling all accounts')
+    principal_query.add_argument('--group', metavar='DISPLAYNAME',
+                                 help='Only reports the accounts and permissionsets of a single group, without crawling all accounts')
+    parser.add_argument('--organizational-unit', metavar='OU_ID', action='append', default=[],
+                        help='Only crawls the accounts of an organizational unit or root, nested organizational units included. Can be repeated')
+    parser.add_argument('--account', metavar='ACCOUNT_ID', action='append', default=[],
+                        help='Only crawls the given account. Can be repeated, combines with --organizational-unit')
+    parser.add_argument('--account-tag', metavar='KEY=VALUE', action='append', default=[],
+                        help='Only crawls accounts tagged with KEY=VALUE. Repeated values of a key match any of them, different keys must all match')
+    parser.add_argument('--permission-set', metavar='PERMISSION_SET_ARN', action='append', default=[],
+                        help='Only crawls the given permissionset. Can be repeated, implies --plan auto')
+    parser.add_argument('--plan', choices=['auto', *SsoAdminRepository.CRAWL_PLANS],
+                        help='Crawls with the cheapest (auto) or the given crawl plan and reports its estimated and actual API calls on stderr')
+    parser.add_argument('--effective-access', action='store_true',
+                        help='Crawls users and groups and expands every group into its member users')
+    parser.add_argument('--checkpoint', metavar='JOURNAL_FILE',
+                        help='Records every completed account/permissionset pair in JOURNAL_FILE, which is removed after a successful run')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continues the failed run recorded in the --checkpoint journal and only crawls the remaining pairs')
+    parser.add_argument('--metrics', metavar='PATH',
+                        help='Writes API call, cache and phase metrics of the run to PATH')
+    parser.add_argument('--metrics-format', choices=['json', 'prometheus'], default='json',
+                        help='Format of the --metrics file. Defaults to json')
+    parser.add_argument('--incremental', metavar='STATE_FILE',
+                        help='Starts from the result stored in STATE_FILE, only re-crawls stale account/permissionset pairs and updates the file')
+    parser.add_argument('--diff', metavar='PATH',
+                        help='Writes the added and removed bindings of an incremental run as JSON to PATH')
+    sharding = parser.add_mutually_exclusive_group()
+    sharding.add_argument('--processes', type=int, default=1,
+                          help='Splits the accounts into N shards, crawls each one in its own process and merges the results. Defaults to 1')
+    sharding.add_argument('--shard', metavar='i/N',
+                          help='Only crawls shard i of N, e.g. on one of N hosts, and writes a partial result to --partial-output')
+    sharding.add_argument('--merge', metavar='PARTIAL_RESULT', nargs='+',
+                          help='Merges partial results of --shard runs into one report instead of crawling')
+    parser.add_argument('--serve', metavar='[HOST:]PORT',
+                        help='Keeps all bindings in memory, refreshes them in the background and serves JSON lookups on HOST (default 127.0.0.1) and PORT')
+    parser.add_argument('--refresh-interval', type=int, default=900,
+                        help='Seconds between two background refreshes of --serve. Defaults to 900')
+    parser.add_argument('--partial-output', metavar='PATH',
+                        help='Partial result file of --shard, or of --merge to merge merged results again')
+    arguments = parser.parse_args()
+    if arguments.shard and not arguments.partial_output:
+        parser.error('--shard requires --partial-output')
+    if arguments.serve and (arguments.merge or arguments.shard or arguments.processes > 1 or arguments.user or arguments.group or arguments.plan):
+        parser.error('--serve can not be combined with --merge, --shard, --processes, --user, --group or --plan')
+    if arguments.serve and (arguments.incremental or arguments.diff):
+        # Every background refresh of the service is incremental already
+        parser.error('--serve can not be combined with --incremental or --diff')
+    if (arguments.merge or arguments.shard or arguments.processes > 1) and (arguments.user or arguments.group or arguments.incremental or arguments.diff):
+        # Shards only crawl and merge the bindings of their accounts
+        parser.error('--merge, --shard and --processes can not be combined with --user, --group, --incremental or --diff')
+    if arguments.resume and not arguments.checkpoint:
+        parser.error('--resume requires --checkpoint')
+    if arguments.format in BINARY_FORMATS and not arguments.output:
+        parser.error(f'--format {arguments.format} requires --output')
+    if arguments.permission_set and not arguments.plan:
+        arguments.plan = 'auto'
+    if arguments.plan and (arguments.incremental or arguments.diff):
+        parser.error('--plan and --permission-set can not be combined with --incremental or --diff')
+    if arguments.plan and (arguments.processes > 1 or arguments.shard):
+        # Every shard would list the assignments of all principals again with the principal-first plan
+        parser.error('--plan and --permission-set can not be combined with --processes or --shard')
+    if (arguments.user or arguments.group) and (arguments.organizational_unit or arguments.account or arguments.account_tag):
+        parser.error('--user and --group can not be combined with --organizational-unit, --account or --account-tag')
+    return arguments
+
+def load_state(state_file):
+    if not os.path.exists(state_file):
+        return None
+    with open(state_file) as state:
+        return json.load(state)
+
+def save_state(state_file, refreshed_at, permissionsets, account_bindings, principal_type):
+    with open(state_file, 'w') as state:
+        json.dump({
+            'refreshed_at': refreshed_at.isoformat(),
+            'principal_type': principal_type,
+            'permissionsets': permissionsets,
+            'bindings': account_bindings
+        }, state, default=str)
+
+def parse_snapshot_ttls(snapshot_ttl_arguments):
+    snapshot_ttls = {}
+    for snapshot_ttl_argument in snapshot_ttl_arguments:
+        entity_type, _, seconds = snapshot_ttl_argument.partition('=')
+        if entity_type not in SnapshotRepository.DEFAULT_TTLS or not seconds.isdigit():
+            raise ValueError(f'--snapshot-ttl must look like ENTITY=SECONDS with ENTITY one of {", ".join(SnapshotRepository.DEFAULT_TTLS)}. Provided value {snapshot_ttl_argument}')
+        snapshot_ttls[entity_type] = int(seconds)
+    return snapshot_ttls
+
+def parse_principal_counts(principal_count_arguments):
+    principal_counts = {}
+    for principal_count_argument in principal_count_arguments:
+        principal_type, _, count = principal_count_argument.partition('=')
+        if principal_type not in ['USER', 'GROUP'] or not count.isdigit():
+            raise ValueError(f'--principal-count must look like TYPE=COUNT with TYPE one of USER, GROUP. Provided value {principal_count_argument}')
+        principal_counts[principal_type] = int(count)
+    return principal_counts
+
+def parse_account_tags(account_tag_arguments):
+    account_tags = {}
+    for account_tag_argument in account_tag_arguments:
+        tag_key, separator, tag_value = account_tag_argument.partition('=')
+        if not tag_key or not separator:
+            raise ValueError(f'--account-tag must look like KEY=VALUE. Provided value {account_tag_argument}')
+        account_tags.setdefault(tag_key, []).append(tag_value)
+    return account_tags
+
+def get_principal_type(arguments):
+    """Effective access needs the group bindings to expand them"""
+    return 'ALL' if arguments.effective_access else arguments.principal_type
+
+def is_organization_wide(arguments):
+    return not (arguments.organizational_unit or arguments.account or arguments.account_tag)
+
+def is_streaming(arguments):
+    return arguments.format in RECORD_WRITERS and not (arguments.incremental or arguments.diff or arguments.effective_access or arguments.plan)
+
+def get_accounts(arguments, account_repository, metrics):
+    """Returns the accounts in scope. Streamed crawls get them lazily and start on the first page of accounts"""
+    accounts = account_repository.iter_accounts(
+            organizational_unit_ids=arguments.organizational_unit or None,
+            account_ids=arguments.account or None,
+            tags=parse_account_tags(arguments.account_tag)
+        )
+    if is_streaming(arguments):
+        return accounts
+    with metrics.phase('account_load'):
+        return list(accounts)
+
+def to_records(accounts, account_bindings):
+    """Flattens the result of get_bindings_for_accounts into the records of SsoAdminRepository.iter_bindings"""
+    for account in accounts:
+        for account_binding in account_bindings[account['Id']]:
+            for principal in account_binding['attached_users']:
+                yield {
+                    'account_id': account['Id'],
+                    'account_name': account['Name'],
+                    'permission_set_arn': account_binding['permission_set_arn'],
+                    'permission_set_name': account_binding['permission_set_name'],
+                    **principal
+                }
+
+def write_account_bindings(arguments, accounts, account_bindings, output_stream):
+    """Writes bindings shaped like the result of get_bindings_for_accounts in the requested format"""
+    if arguments.format in RECORD_WRITERS:
+        RECORD_WRITERS[arguments.format](
+                to_records(accounts, account_bindings),
+                output_stream
+            )
+    else:
+        for account in accounts:
+            userassignments = account_bindings[account['Id']]
+            # Example Output
+            # {
+            #   "Id": "123456789123",
+            #   "Name": "fanyaccount",
+            #   "userassignments": [
+            #     {
+            #       "permission_set_arn": "arn:aws:sso:::permissionSet/ssoins-27348293579/ps-aa89082359dfs",
+            #       "permission_set_name": "AWSReadOnlyAccess",
+            #       "attached_users": [
+            #         {
+            #           "PrincipalType": "USER",
+            #           "Id": "23a4cd82-c231-ac70-b5f5-791ae20f974c",
+            #           "Name": "fancyuser"
+            #         }
+            #       ]
+            #     }
+            #   ]
+            # }
+            print ({
+                **account,
+                'userassignments': userassignments
+            }, file=output_stream)
+
+def write_principal_assignments(arguments, ssoadmin_repository, account_repository, output_stream):
+    """Looks up the bindings of the --user or --group principal and writes them in the requested format"""
+    identitystore_repository = ssoadmin_repository.identitystore_repository
+    if arguments.user:
+        account_bindings = ssoadmin_repository.get_bindings_by_principal(identitystore_repository.get_user_id_by_username(arguments.user), 'USER')
+    else:
+        account_bindings = ssoadmin_repository.get_bindings_by_principal(identitystore_repository.get_group_id_by_groupname(arguments.group), 'GROUP')
+    # Only describes the accounts of the principal instead of listing the whole organization.
+    # Accounts which are no longer active keep the name None like with get_accountname_by_id
+    account_names = {account['Id']: account['Name'] for account in account_repository.iter_accounts(account_ids=list(account_bindings))}
+    accounts = [
+        {'Id': account_id, 'Name': account_names.get(account_id)}
+        for account_id in account_bindings
+    ]
+    write_account_bindings(arguments, accounts, account_bindings, output_stream)
+
+def write_assignments(arguments, ssoadmin_repository, accounts, output_stream):
+    """Crawls the bindings of accounts and writes them in the requested format"""
+    principal_type = get_principal_type(arguments)
+    if is_streaming(arguments):
+        RECORD_WRITERS[arguments.format](
+                ssoadmin_repository.iter_bindings(accounts, principal_type=principal_type, max_workers=arguments.workers,
+                                                  organization_wide=is_organization_wide(arguments)),
+                output_stream
+            )
+    elif arguments.plan:
+        account_bindings, crawl_report = ssoadmin_repository.get_bindings_planned(
+                [account['Id'] for account in accounts],
+                permission_set_arns=arguments.permission_set or None,
+                principal_type=principal_type,
+                max_workers=arguments.workers,
+                plan=None if arguments.plan == 'auto' else arguments.plan
+            )
+        print(f"Crawl plan {crawl_report['plan']}: estimated {crawl_report['estimated_calls']} API calls, actual {crawl_report['actual_calls']}. "
+              f"Estimates: {crawl_report['estimates']}", file=sys.stderr)
+        if arguments.effective_access:
+            account_bindings = ssoadmin_repository.expand_effective_access(account_bindings, max_workers=arguments.workers)
+        write_account_bindings(arguments, accounts, account_bindings, output_stream)
+    elif arguments.format == 'repr' and not (arguments.incremental or arguments.diff or arguments.effective_access):
+        assignment_graph = ssoadmin_repository.build_assignment_graph(accounts, principal_type=principal_type, max_workers=arguments.workers)
+        for account, userassignments in assignment_graph.iter_account_bindings():
+            print ({
+                **account,
+                'userassignments': userassignments
+            }, file=output_stream)
+    else:
+        account_ids = [account['Id'] for account in accounts]
+        started_at = datetime.now(timezone.utc)
+        previous_state = load_state(arguments.incremental) if arguments.incremental else None
+        # State files written before the principal type was stored only contain user bindings
+        if previous_state and previous_state.get('principal_type', 'USER') != principal_type:
+            logging.warning(f"State of {arguments.incremental} holds {previous_state.get('principal_type', 'USER')} bindings, crawling all {principal_type} bindings again")
+            previous_state = None
+        if previous_state:
+            account_bindings, bindings_diff = ssoadmin_repository.refresh_bindings(
+                    account_ids,
+                    previous_state['permissionsets'],
+                    previous_state['bindings'],
+                    since=datetime.fromisoformat(previous_state['refreshed_at']),
+                    principal_type=principal_type,
+                    max_workers=arguments.workers
+                )
+        else:
+            account_bindings = ssoadmin_repository.get_bindings_for_accounts(
+                    account_ids,
+                    max_workers=arguments.workers,
+                    principal_type=principal_type
+                )
+            bindings_diff = SsoAdminRepository.diff_bindings({}, account_bindings)
+        if arguments.incremental:
+            save_state(arguments.incremental, started_at, ssoadmin_repository.permissionsets, account_bindings, principal_type)
+        if arguments.diff:
+            with open(arguments.diff, 'w') as diff_file:
+                json.dump(bindings_diff, diff_file)
+        if arguments.effective_access:
+            account_bindings = ssoadmin_repository.expand_effective_access(account_bindings, max_workers=arguments.workers)
+        write_account_bindings(arguments, accounts, account_bindings, output_stream)
+
+def parse_serve_address(serve_address):
+    host, _, port = serve_address.rpartition(':')
+    if not port.isdigit():
+        raise ValueError(f'--serve must look like [HOST:]PORT. Provided value {serve_address}')
+    return host or '127.0.0.1', int(port)
+
+def open_checkpoint_journal(arguments, metrics, journal_suffix=''):
+    if not arguments.checkpoint:
+        return None
+    return CheckpointJournal(arguments.checkpoint + journal_suffix, resume=arguments.resume, metrics=metrics)
+
+def create_client_factory(arguments):
+    return ClientFactory(
+            profile_name=arguments.profile,
+            region_name=arguments.region,
+            max_workers=arguments.workers,
+            connect_timeout=arguments.connect_timeout,
+            read_timeout=arguments.read_timeout,
+            retry_mode=arguments.retry_mode,
+            max_attempts=arguments.max_attempts
+        )
+
+def create_snapshot_repository(arguments, metrics):
+    if not arguments.snapshot:
+        return None
+    return SnapshotRepository(
+            arguments.snapshot,
+            parse_snapshot_ttls(arguments.snapshot_ttl),
+            metrics=metrics
+        )
+
+def create_repositories(arguments, metrics, checkpoint_journal=None, client_factory=None, snapshot_repository=None):
+    """Creates the repositories, on the given client factory and snapshot if a long running caller shares them"""
+    if client_factory is None:
+        client_factory = create_client_factory(arguments)
+    if snapshot_repository is None:
+        snapshot_repository = create_snapshot_repository(arguments, metrics)
+    sso_admin_client = client_factory.get_lazy_client('sso-admin')
+    organizations_client = client_factory.get_lazy_client('organizations')
+    identitystore_client = client_factory.get_lazy_client('identitystore')
+
+    rate_limiter = RateLimiter()
     ssoadmin_repository = SsoAdminRepository(
                 sso_admin_client,
-                identitystore_client
+                identitystore_client,
+                snapshot_repository=snapshot_repository,
+                rate_limiter=rate_limiter,
+                metrics=metrics,
+                checkpoint_journal=checkpoint_journal,
+                max_cached_principals=arguments.max_cached_principals,
+                describe_permissionsets=not arguments.skip_permissionset_descriptions,
+                principal_counts=parse_principal_counts(arguments.principal_count)
             )
-    account_repository = AccountRepository(organizations_client)
-    
-    accounts = account_repository.get_all_accounts()
-    account_user_assignments = []
-    for account in accounts:
-        userassignments = ssoadmin_repository.get_bindings_by_account_id(account['Id'])
-        # Example Output
-        # {
-        #   "Id": "123456789123",
-        #   "Name": "fanyaccount",
-        #   "userassignments": [
-        #     {
-        #       "permission_set_arn": "arn:aws:sso:::permissionSet/ssoins-27348293579/ps-aa89082359dfs",
-        #       "permission_set_name": "AWSReadOnlyAccess",
-        #       "attached_users": [
-        #         {
-        #           "PrincipalType": "USER",
-        #           "Id": "23a4cd82-c231-ac70-b5f5-791ae20f974c",
-        #           "Name": "fancyuser"
-        #         }
-        #       ]
-        #     }
-        #   ]
-        # }
-        account_user_assignments.append({
-            **account,
-            'userassignments': userassignments
-        })
-    
-    for account_assignments in account_user_assignments:
-        print (account_assignments)
\ No newline at end of file
+    account_repository = AccountRepository(
+                organizations_client,
+                snapshot_repository=snapshot_repository,
+                rate_limiter=rate_limiter,
+                metrics=metrics
+            )
+    return ssoadmin_repository, account_repository
+
+def crawl_shard(arguments, shard_index, shard_count, partial_result_path):
+    """Crawls shard i of N of all accounts and writes a partial result. Runs in its own process with --processes"""
+    logging.basicConfig(level=logging.WARNING)
+    metrics = Metrics()
+    # Every shard process keeps its own journal
+    checkpoint_journal = open_checkpoint_journal(arguments, metrics, f'.shard-{shard_index}-of-{shard_count}')
+    ssoadmin_repository, account_repository = create_repositories(arguments, metrics, checkpoint_journal)
+    accounts = shard_accounts(get_accounts(arguments, account_repository, metrics), shard_index, shard_count)
+    logging.info(f'Crawling {len(accounts)} accounts of shard {shard_index}/{shard_count}')
+    with metrics.phase('assignment_crawl'):
+        account_bindings = ssoadmin_repository.get_bindings_for_accounts(
+                [account['Id'] for account in accounts],
+                max_workers=arguments.workers,
+                principal_type=get_principal_type(arguments)
+            )
+        if arguments.effective_access:
+            account_bindings = ssoadmin_repository.expand_effective_access(account_bindings, max_workers=arguments.workers)
+    write_partial_result(partial_result_path, f'{shard_index}/{shard_count}', accounts, account_bindings, ssoadmin_repository.identitystore_repository)
+    if checkpoint_journal:
+        checkpoint_journal.complete()
+
+def crawl_shards_in_processes(arguments, partial_result_directory):
+    """Runs one crawl_shard process per shard and returns the paths of their partial results"""
+    partial_result_paths = [os.path.join(partial_result_directory, f'shard-{shard_index}.json') for shard_index in range(1, arguments.processes + 1)]
+    with ProcessPoolExecutor(max_workers=arguments.processes, mp_context=get_context('spawn')) as executor:
+        shard_futures = [
+            executor.submit(crawl_shard, arguments, shard_index, arguments.processes, partial_result_path)
+            for shard_index, partial_result_path in enumerate(partial_result_paths, start=1)
+        ]
+        for shard_future in shard_futures:
+            shard_future.result()
+    return partial_result_paths
+
+def write_merged_result(arguments, partial_result_paths, output_stream):
+    merged_result = merge_partial_results(partial_result_paths)
+    if arguments.partial_output:
+        with open(arguments.partial_output, 'w') as partial_result_file:
+            json.dump(merged_result, partial_result_file)
+    write_account_bindings(arguments, merged_result['accounts'], merged_result['bindings'], output_stream)
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    logging.basicConfig(level=logging.WARNING)
+    metrics = Metrics()
+    if arguments.format in BINARY_FORMATS:
+        output_stream = open(arguments.output, 'wb')
+    else:
+        output_stream = open(arguments.output, 'w', newline='') if arguments.output else sys.stdout
+
+    if arguments.serve:
+        # Full refreshes create new repositories, but share the connection pools and the snapshot connection
+        client_factory = create_client_factory(arguments)
+        snapshot_repository = create_snapshot_repository(arguments, metrics)
+        assignment_service = AssignmentService(
+                lambda: create_repositories(arguments, metrics, client_factory=client_factory, snapshot_repository=snapshot_repository),
+                principal_type=get_principal_type(arguments),
+                max_workers=arguments.workers,
+                refresh_interval=arguments.refresh_interval,
+                account_loader=lambda account_repository: list(get_accounts(arguments, account_repository, metrics))
+            )
+        with metrics.phase('assignment_crawl'):
+            assignment_service.refresh()
+        assignment_service.start()
+        serve(assignment_service, *parse_serve_address(arguments.serve), metrics=metrics)
+        if snapshot_repository:
+            snapshot_repository.close()
+    elif arguments.merge:
+        write_merged_result(arguments, arguments.merge, output_stream)
+    elif arguments.shard:
+        crawl_shard(arguments, *parse_shard(arguments.shard), arguments.partial_output)
+    elif arguments.processes > 1:
+        with tempfile.TemporaryDirectory() as partial_result_directory:
+            write_merged_result(arguments, crawl_shards_in_processes(arguments, partial_result_directory), output_stream)
+    else:
+        checkpoint_journal = open_checkpoint_journal(arguments, metrics)
+        ssoadmin_repository, account_repository = create_repositories(arguments, metrics, checkpoint_journal)
+        if arguments.user or arguments.group:
+            with metrics.phase('assignment_crawl'):
+                write_principal_assignments(arguments, ssoadmin_repository, account_repository, output_stream)
+        else:
+            accounts = get_accounts(arguments, account_repository, metrics)
+            # Permissionsets are loaded in parallel on first use, get_bindings_for_accounts already crawls while loading them
+            with metrics.phase('assignment_crawl'):
+                write_assignments(arguments, ssoadmin_repository, accounts, output_stream)
+        if checkpoint_journal:
+            checkpoint_journal.complete()
+    if output_stream is not sys.stdout:
+        output_stream.close()
+    if arguments.metrics:
+        with open(arguments.metrics, 'w') as metrics_file:
+            metrics_file.write(metrics.to_prometheus() if arguments.metrics_format == 'prometheus' else metrics.to_json())
\ No newline at end of file
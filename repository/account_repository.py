@@ -1,16 +1,33 @@
 import itertools
 import logging
+from botocore.exceptions import ClientError
+from repository.metrics import Metrics
+from repository.rate_limiter import RateLimitedClient, RateLimiter
 
 class AccountRepository:
-    def __init__(self, boto3_organizations_client):
+    def __init__(self, boto3_organizations_client, snapshot_repository=None, rate_limiter=None, metrics=None):
         """
+        snapshot_repository: Optional SnapshotRepository the accounts are read through
+        rate_limiter: Optional RateLimiter shared with the other repositories
+        metrics: Optional Metrics shared with the other repositories
+
+        Accounts are loaded lazily: the whole organization on first use of get_all_accounts,
+        or only the accounts in scope with iter_accounts.
         Example:
             account_repository = AccountRepository(
                 boto3.client('organizations')
             )
         """
-        self._organizations_client = boto3_organizations_client
-        self.active_accounts = self._load_active_accounts()
+        self.metrics = metrics or Metrics()
+        self._organizations_client = RateLimitedClient(boto3_organizations_client, rate_limiter or RateLimiter(), self.metrics)
+        self._snapshot_repository = snapshot_repository
+        self.accounts_by_id = {}
+        self._active_accounts = None
+        self._account_tags = {}
+
+    @property
+    def active_accounts(self):
+        return self._load_active_accounts()
     
     def get_all_account_ids(self):
         return [account['Id'] for account in self.active_accounts]
@@ -29,8 +46,131 @@ class AccountRepository:
         """
         return [{ 'Id': account['Id'], 'Name': account['Name'] }  for account in self.active_accounts]
     
+    def reload_accounts(self):
+        """Drops the loaded accounts and loads the whole organization again, e.g. for a long running service"""
+        self.forget_accounts()
+        return self.get_all_accounts()
+
+    def forget_accounts(self):
+        """Drops the loaded accounts and their tags, the next get_all_accounts or iter_accounts loads them again"""
+        self._active_accounts = None
+        self.accounts_by_id = {}
+        self._account_tags = {}
+
+    def get_account_by_id(self, account_id:str) -> dict:
+        if account_id not in self.accounts_by_id:
+            self._load_active_accounts()
+        return self.accounts_by_id.get(account_id)
+
     def get_accountname_by_id(self, account_id:str) -> str:
-        return next((account['Name'] for account in self.active_accounts if account['Id'] == account_id),None)
+        account = self.get_account_by_id(account_id)
+        return account['Name'] if account else None
+
+    def iter_accounts(self, organizational_unit_ids=None, account_ids=None, tags=None):
+        """Yields the active accounts in scope as soon as the page containing them arrives
+
+        Without organizational_unit_ids and account_ids the whole organization is in scope,
+        otherwise the union of both. Accounts are yielded once, even if several scopes contain them.
+
+        Parameters
+        -------
+        organizational_unit_ids : list(str)
+          Ids of organizational units or of the root, accounts of nested organizational units included
+        account_ids : list(str)
+          Unknown account ids are skipped with a warning
+        tags : dict(str, list(str))
+          Only yields accounts having, for every tag key, one of the values. Costs one
+          organizations:ListTagsForResource call per account in scope
+          example: {'Environment': ['prod']}
+
+        Yields
+        -------
+        account : dict
+          example: {
+            'Id': '696969696969',
+            'Name': 'secretaccount'
+          }
+
+        Raises
+        ------
+        Organizations.Client.exceptions.AccessDeniedException
+        Organizations.Client.exceptions.AWSOrganizationsNotInUseException
+        Organizations.Client.exceptions.InvalidInputException
+        Organizations.Client.exceptions.ParentNotFoundException
+        Organizations.Client.exceptions.ServiceException
+        Organizations.Client.exceptions.TooManyRequestsException
+        """
+        if organizational_unit_ids is None and account_ids is None:
+            accounts = self._active_accounts if self._active_accounts is not None else self._iter_organization_accounts()
+        else:
+            accounts = itertools.chain(
+                self._iter_accounts_by_id(account_ids or []),
+                self._iter_accounts_by_parents(organizational_unit_ids or [])
+                )
+        yielded_account_ids = set()
+        for account in accounts:
+            if account['Status'] != 'ACTIVE' or account['Id'] in yielded_account_ids:
+                continue
+            yielded_account_ids.add(account['Id'])
+            if tags and not self._has_tags(account['Id'], tags):
+                continue
+            self.accounts_by_id[account['Id']] = account
+            yield { 'Id': account['Id'], 'Name': account['Name'] }
+
+    def _iter_accounts_by_id(self, account_ids):
+        for account_id in account_ids:
+            if account_id in self.accounts_by_id:
+                yield self.accounts_by_id[account_id]
+                continue
+            logging.info(f'Calling organizations:DescribeAccount API for {account_id}')
+            try:
+                yield self._organizations_client.describe_account(AccountId=account_id)['Account']
+            except ClientError as error:
+                if error.response.get('Error', {}).get('Code') != 'AccountNotFoundException':
+                    raise
+                logging.warning(f'Account {account_id} not found in the organization, skipping it')
+
+    def _iter_accounts_by_parents(self, parent_ids):
+        """Walks the organizational unit tree breadth first, accounts of a parent before its child organizational units"""
+        pending_parent_ids = list(parent_ids)
+        visited_parent_ids = set()
+        while pending_parent_ids:
+            parent_id = pending_parent_ids.pop(0)
+            if parent_id in visited_parent_ids:
+                continue
+            visited_parent_ids.add(parent_id)
+            logging.info(f'Calling organizations:ListAccountsForParent API for {parent_id}')
+            # Accounts are shaped like the ones of organizations:ListAccounts
+            for account_page in self._organizations_client.get_paginator('list_accounts_for_parent').paginate(ParentId=parent_id, MaxResults=20):
+                yield from account_page['Accounts']
+            logging.info(f'Calling organizations:ListChildren API for {parent_id}')
+            # Returns
+            # [
+            #     {
+            #         'Id': 'string',
+            #         'Type': 'ACCOUNT'|'ORGANIZATIONAL_UNIT'
+            #     }
+            # ]
+            for child_page in self._organizations_client.get_paginator('list_children').paginate(ParentId=parent_id, ChildType='ORGANIZATIONAL_UNIT', MaxResults=20):
+                pending_parent_ids.extend(child['Id'] for child in child_page['Children'])
+
+    def _has_tags(self, account_id: str, tags) -> bool:
+        if account_id not in self._account_tags:
+            logging.info(f'Calling organizations:ListTagsForResource API for {account_id}')
+            # Returns
+            # [
+            #     {
+            #         'Key': 'string',
+            #         'Value': 'string'
+            #     }
+            # ]
+            self._account_tags[account_id] = {
+                tag['Key']: tag['Value']
+                for tag_page in self._organizations_client.get_paginator('list_tags_for_resource').paginate(ResourceId=account_id)
+                for tag in tag_page['Tags']
+            }
+        account_tags = self._account_tags[account_id]
+        return all(account_tags.get(tag_key) in tag_values for tag_key, tag_values in tags.items())
     
     def _load_active_accounts(self):
         """Retrieves all account in your organization.
@@ -54,8 +194,21 @@ class AccountRepository:
         ----------
         .. [1] "Boto3 Endpoint", https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/organizations/client/list_accounts.html
         """
-        if hasattr(self,'active_accounts'):
-            return self.active_accounts
+        if self._active_accounts is None:
+            for _ in self._iter_organization_accounts():
+                pass
+        return self._active_accounts
+
+    def _iter_organization_accounts(self):
+        """Yields every account of the organization page by page and keeps the active ones once the last page arrived"""
+        if self._snapshot_repository:
+            cached_accounts = self._snapshot_repository.get('accounts', 'active')
+            if cached_accounts is not None:
+                logging.info(f'Loaded {len(cached_accounts)} active accounts from snapshot')
+                self._active_accounts = cached_accounts
+                self.accounts_by_id.update({account['Id']: account for account in self._active_accounts})
+                yield from self._active_accounts
+                return
         paginator =  self._organizations_client.get_paginator('list_accounts')
         logging.info(f'Loading all active account with organizations:ListAccounts API call')
         account_page_iterator = paginator.paginate(MaxResults=20)
@@ -71,10 +224,13 @@ class AccountRepository:
         #         'JoinedTimestamp': datetime(2015, 1, 1)
         #     }
         # ]
-        accounts = list(
-            itertools.chain(
-                *[account_page['Accounts'] for account_page in account_page_iterator]
-                ))
-        self.active_accounts =  [account for account in accounts if account['Status'] == 'ACTIVE']
-        return self.active_accounts
-        
\ No newline at end of file
+        active_accounts = []
+        for account_page in account_page_iterator:
+            for account in account_page['Accounts']:
+                if account['Status'] == 'ACTIVE':
+                    active_accounts.append(account)
+                    self.accounts_by_id[account['Id']] = account
+                yield account
+        self._active_accounts = active_accounts
+        if self._snapshot_repository:
+            self._snapshot_repository.put('accounts', 'active', self._active_accounts)
@@ -0,0 +1,159 @@
+import sys
+from array import array
+
+PRINCIPAL_TYPES = ['USER', 'GROUP']
+
+class AssignmentGraph:
+    __slots__ = (
+        'account_ids', 'account_names', '_account_keys',
+        'permission_set_arns', 'permission_set_names', '_permission_set_keys',
+        'principal_types', 'principal_ids', 'principal_names', '_principal_keys',
+        'binding_accounts', 'binding_permission_sets', 'binding_principals'
+    )
+
+    def __init__(self):
+        """Compact in-memory assignment graph
+
+        Accounts, permissionsets and principals are stored once with interned strings and addressed by small
+        integer keys, every binding is a row of three unsigned integer columns. Dict shaped records and
+        bindings are only created while iterating, at the output boundary.
+
+        Bindings of an account/permissionset pair must be added contiguously and in the order their
+        accounts were added, as build_assignment_graph of the SsoAdminRepository does. compact drops
+        the key lookups of a completely built graph.
+
+        Example:
+            assignment_graph = ssoadmin_repository.build_assignment_graph(account_repository.get_all_accounts())
+            for account, account_bindings in assignment_graph.iter_account_bindings():
+                print(account, account_bindings)
+        """
+        self.account_ids = []
+        self.account_names = []
+        self._account_keys = {}
+        self.permission_set_arns = []
+        self.permission_set_names = []
+        self._permission_set_keys = {}
+        self.principal_types = bytearray()
+        self.principal_ids = []
+        self.principal_names = []
+        self._principal_keys = {principal_type: {} for principal_type in PRINCIPAL_TYPES}    # No tuple key per principal
+        self.binding_accounts = array('I')
+        self.binding_permission_sets = array('I')
+        self.binding_principals = array('I')
+
+    def __len__(self):
+        return len(self.binding_principals)
+
+    def compact(self):
+        """Drops the key lookups which are only needed while adding, the next add rebuilds them"""
+        self._account_keys = None
+        self._permission_set_keys = None
+        self._principal_keys = None
+
+    def add_account(self, account_id: str, account_name: str) -> int:
+        if self._account_keys is None:
+            self._account_keys = {account_id: account_key for account_key, account_id in enumerate(self.account_ids)}
+        account_key = self._account_keys.get(account_id)
+        if account_key is None:
+            account_key = self._account_keys[sys.intern(account_id)] = len(self.account_ids)
+            self.account_ids.append(sys.intern(account_id))
+            self.account_names.append(account_name)
+        return account_key
+
+    def add_permission_set(self, permission_set_arn: str, permission_set_name: str) -> int:
+        if self._permission_set_keys is None:
+            self._permission_set_keys = {permission_set_arn: permission_set_key for permission_set_key, permission_set_arn in enumerate(self.permission_set_arns)}
+        permission_set_key = self._permission_set_keys.get(permission_set_arn)
+        if permission_set_key is None:
+            permission_set_key = self._permission_set_keys[sys.intern(permission_set_arn)] = len(self.permission_set_arns)
+            self.permission_set_arns.append(sys.intern(permission_set_arn))
+            self.permission_set_names.append(sys.intern(permission_set_name))
+        return permission_set_key
+
+    def add_principal(self, principal_type: str, principal_id: str, principal_name: str) -> int:
+        if self._principal_keys is None:
+            self._principal_keys = {principal_type: {} for principal_type in PRINCIPAL_TYPES}
+            for principal_key, (principal_type_index, known_principal_id) in enumerate(zip(self.principal_types, self.principal_ids)):
+                self._principal_keys[PRINCIPAL_TYPES[principal_type_index]][known_principal_id] = principal_key
+        principal_keys = self._principal_keys[principal_type]
+        principal_key = principal_keys.get(principal_id)
+        if principal_key is None:
+            principal_key = principal_keys[sys.intern(principal_id)] = len(self.principal_ids)
+            self.principal_types.append(PRINCIPAL_TYPES.index(principal_type))
+            self.principal_ids.append(sys.intern(principal_id))
+            self.principal_names.append(principal_name)
+        return principal_key
+
+    def add_binding(self, account_key: int, permission_set_key: int, principal_key: int):
+        self.binding_accounts.append(account_key)
+        self.binding_permission_sets.append(permission_set_key)
+        self.binding_principals.append(principal_key)
+
+    def add_record(self, record):
+        """Adds a flat record as yielded by SsoAdminRepository.iter_bindings"""
+        self.add_binding(
+            self.add_account(record['account_id'], record['account_name']),
+            self.add_permission_set(record['permission_set_arn'], record['permission_set_name']),
+            self.add_principal(record['PrincipalType'], record['Id'], record['Name'])
+        )
+
+    @classmethod
+    def from_account_bindings(cls, accounts, account_bindings):
+        """Builds the graph of bindings shaped like the result of get_bindings_for_accounts, ordered like accounts"""
+        assignment_graph = cls()
+        account_keys = [assignment_graph.add_account(account['Id'], account['Name']) for account in accounts]
+        for account_key, account in zip(account_keys, accounts):
+            for account_binding in account_bindings.get(account['Id'], []):
+                permission_set_key = assignment_graph.add_permission_set(account_binding['permission_set_arn'], account_binding['permission_set_name'])
+                for principal in account_binding['attached_users']:
+                    assignment_graph.add_binding(account_key, permission_set_key, assignment_graph.add_principal(principal['PrincipalType'], principal['Id'], principal['Name']))
+        assignment_graph.compact()
+        return assignment_graph
+
+    def _to_principal(self, principal_key: int):
+        principal = {
+            'PrincipalType': PRINCIPAL_TYPES[self.principal_types[principal_key]],
+            'Id': self.principal_ids[principal_key],
+            'Name': self.principal_names[principal_key]
+        }
+        if principal['Name'] is None:    # Orphaned principals are only stored without name
+            principal['Orphaned'] = True
+        return principal
+
+    def get_record(self, binding_index: int):
+        """Returns a binding as flat record of SsoAdminRepository.iter_bindings"""
+        account_key = self.binding_accounts[binding_index]
+        permission_set_key = self.binding_permission_sets[binding_index]
+        return {
+            'account_id': self.account_ids[account_key],
+            'account_name': self.account_names[account_key],
+            'permission_set_arn': self.permission_set_arns[permission_set_key],
+            'permission_set_name': self.permission_set_names[permission_set_key],
+            **self._to_principal(self.binding_principals[binding_index])
+        }
+
+    def iter_records(self):
+        """Yields the flat records of SsoAdminRepository.iter_bindings"""
+        for binding_index in range(len(self)):
+            yield self.get_record(binding_index)
+
+    def iter_account_bindings(self):
+        """Yields every account, including accounts without bindings, with its bindings shaped like get_bindings_by_account_id"""
+        binding_index = 0
+        for account_key, (account_id, account_name) in enumerate(zip(self.account_ids, self.account_names)):
+            account_bindings = []
+            while binding_index < len(self) and self.binding_accounts[binding_index] == account_key:
+                permission_set_key = self.binding_permission_sets[binding_index]
+                if not account_bindings or account_bindings[-1]['permission_set_arn'] != self.permission_set_arns[permission_set_key]:
+                    account_bindings.append({
+                        'permission_set_arn': self.permission_set_arns[permission_set_key],
+                        'permission_set_name': self.permission_set_names[permission_set_key],
+                        'attached_users': []
+                    })
+                account_bindings[-1]['attached_users'].append(self._to_principal(self.binding_principals[binding_index]))
+                binding_index += 1
+            yield {'Id': account_id, 'Name': account_name}, account_bindings
+
+    def to_account_bindings(self):
+        """Returns all bindings shaped like the result of get_bindings_for_accounts"""
+        return {account['Id']: account_bindings for account, account_bindings in self.iter_account_bindings()}
@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import threading
+
+class CheckpointJournal:
+    def __init__(self, journal_path: str, resume=False, metrics=None):
+        """Append-only journal of completed account/permissionset crawl units with their resolved bindings
+
+        Every completed unit is appended as one JSON line and flushed right away, so a crawl that fails or
+        runs out of credentials keeps its progress. With resume=True the units of an existing journal are
+        served from it instead of being crawled again, otherwise an existing journal is started over.
+        Resumed units are recorded as hits of the 'checkpoint' cache in the optional Metrics.
+
+        Example:
+            checkpoint_journal = CheckpointJournal('crawl.journal', resume=True)
+            ssoadmin_repository = SsoAdminRepository(
+                boto3.client('sso-admin'),
+                boto3.client('identitystore'),
+                checkpoint_journal=checkpoint_journal
+            )
+            ...
+            checkpoint_journal.complete()
+        """
+        self.journal_path = journal_path
+        self._metrics = metrics
+        self._completed_units = {}
+        if resume:
+            self._completed_units = self._load()
+            self._truncate_incomplete_line()
+            logging.info(f'Resuming {len(self._completed_units)} completed crawl units from {journal_path}')
+        self._journal_lock = threading.Lock()    # Units complete in several crawl threads
+        self._journal_file = open(journal_path, 'a' if resume else 'w')
+
+    def _load(self):
+        if not os.path.exists(self.journal_path):
+            return {}
+        completed_units = {}
+        with open(self.journal_path) as journal_file:
+            for line in journal_file:
+                try:
+                    # {
+                    #   'account_id': 'string',
+                    #   'permission_set_arn': 'string',
+                    #   'principal_type': 'USER'|'GROUP'|'ALL',
+                    #   'bindings': [{'PrincipalType': 'USER', 'Id': 'string', 'Name': 'string'}]
+                    # }
+                    unit = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(f'Skipping incomplete line of checkpoint journal {self.journal_path}')    # Interrupted while writing
+                    continue
+                completed_units[(unit['account_id'], unit['permission_set_arn'], unit['principal_type'])] = unit['bindings']
+        return completed_units
+
+    def _truncate_incomplete_line(self):
+        """Cuts a line torn by an interrupted write, so the first appended unit starts on a line of its own"""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'rb+') as journal_file:
+            content = journal_file.read()
+            if content and not content.endswith(b'\n'):
+                journal_file.truncate(content.rfind(b'\n') + 1)
+
+    def get(self, account_id: str, permission_set_arn: str, principal_type: str):
+        """Returns the bindings of a completed unit or None if it still has to be crawled"""
+        bindings = self._completed_units.get((account_id, permission_set_arn, principal_type))
+        if self._metrics is not None:
+            self._metrics.record_cache('checkpoint', bindings is not None)
+        return bindings
+
+    def get_completed_units(self, principal_type: str):
+        """Returns the (account_id, permission_set_arn) pairs already completed for principal_type"""
+        with self._journal_lock:
+            return {
+                (account_id, permission_set_arn)
+                for account_id, permission_set_arn, completed_principal_type in self._completed_units
+                if completed_principal_type == principal_type
+            }
+
+    def record(self, account_id: str, permission_set_arn: str, principal_type: str, bindings):
+        line = json.dumps({
+            'account_id': account_id,
+            'permission_set_arn': permission_set_arn,
+            'principal_type': principal_type,
+            'bindings': bindings
+        })
+        with self._journal_lock:
+            self._completed_units[(account_id, permission_set_arn, principal_type)] = bindings
+            self._journal_file.write(line + '\n')
+            self._journal_file.flush()
+
+    def close(self):
+        with self._journal_lock:
+            self._journal_file.close()
+
+    def complete(self):
+        """Closes and removes the journal after the crawl finished, a later resume starts from scratch"""
+        self.close()
+        os.remove(self.journal_path)
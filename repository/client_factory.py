@@ -0,0 +1,58 @@
+import logging
+import threading
+import boto3
+from botocore.config import Config
+
+class ClientFactory:
+    def __init__(self, profile_name=None, region_name=None, max_workers=10, connect_timeout=5, read_timeout=30,
+                 retry_mode='standard', max_attempts=1):
+        """Creates the boto3 clients of all repositories from one session with shared transport settings
+
+        Every client keeps max(10, max_workers) pooled keep-alive connections, so parallel crawls neither wait for a
+        connection nor repeat TLS handshakes. The session and the clients are only created on the first API call,
+        a run served from the snapshot therefore never resolves credentials.
+        botocore makes max_attempts calls per request in total, throttling retries included. The default of a single
+        attempt hands every throttling error to the RateLimiter, which lowers the rate of the operation and retries,
+        instead of botocore retrying it unnoticed while the RateLimiter keeps its rate. The RateLimiter also retries
+        transient server and connection errors.
+
+        Example:
+            client_factory = ClientFactory(profile_name='fancyprofile', max_workers=32)
+            account_repository = AccountRepository(
+                client_factory.get_lazy_client('organizations')
+            )
+        """
+        self.profile_name = profile_name
+        self.region_name = region_name
+        self.config = Config(
+            max_pool_connections=max(10, max_workers),
+            tcp_keepalive=True,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            retries={'mode': retry_mode, 'total_max_attempts': max_attempts}
+        )
+        self._session = None
+        self._clients = {}
+        self._clients_lock = threading.Lock()    # boto3 sessions are not thread safe
+
+    def get_client(self, service_name: str):
+        """Returns the client of a service, created once per factory"""
+        with self._clients_lock:
+            if service_name not in self._clients:
+                if self._session is None:
+                    self._session = boto3.session.Session(profile_name=self.profile_name, region_name=self.region_name)
+                logging.info(f'Creating {service_name} client with up to {self.config.max_pool_connections} pooled connections')
+                self._clients[service_name] = self._session.client(service_name, config=self.config)
+            return self._clients[service_name]
+
+    def get_lazy_client(self, service_name: str):
+        return LazyClient(self, service_name)
+
+class LazyClient:
+    def __init__(self, client_factory: ClientFactory, service_name: str):
+        """Stands in for the client of a service and only creates it on first use"""
+        self._client_factory = client_factory
+        self._service_name = service_name
+
+    def __getattr__(self, name):
+        return getattr(self._client_factory.get_client(self._service_name), name)
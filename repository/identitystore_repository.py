@@ -1,18 +1,262 @@
 import logging
+import math
+import threading
+from botocore.exceptions import ClientError
+from repository.metrics import Metrics
+from repository.principal_cache import PrincipalCache
+from repository.rate_limiter import RateLimitedClient, RateLimiter
 
 class IdentitystoreRepository:
-    def __init__(self, boto3_identitystore_client, identitystore_id: str):
+    # Principals per ListUsers/ListGroups page of a bulk load
+    BULK_LOAD_PAGE_SIZE = 100
+
+    def __init__(self, boto3_identitystore_client, identitystore_id: str, bulk_load_threshold=100, snapshot_repository=None, rate_limiter=None, metrics=None,
+                 max_cached_principals=None, principal_counts=None):
         """
+        bulk_load_threshold: Number of expected principals from which prefetch_principals pages
+                             through the whole identitystore instead of describing every principal,
+                             as long as the size of the identitystore is unknown. None disables the bulk load.
+        principal_counts: Optional known number of principals per type, e.g. {'USER': 30000, 'GROUP': 800}.
+                          Lets prefetch_principals weigh the pages of a bulk load against on-demand lookups.
+                          Bulk loads update the counts.
+        max_cached_principals: Upper bound of cached user names, group names and group memberships each,
+                               the least recently used entries are evicted first. None keeps every entry.
+        snapshot_repository: Optional SnapshotRepository the principal names are read through
+        rate_limiter: Optional RateLimiter shared with the other repositories
+        metrics: Optional Metrics shared with the other repositories
         Example:
             identitystore_repository = IdentitystoreRepository(
                 boto3.client('identitystore'),
                 'd-9967177d78'
             )
         """
-        self._identitystore_client = boto3_identitystore_client
+        self.metrics = metrics or Metrics()
+        self._identitystore_client = RateLimitedClient(boto3_identitystore_client, rate_limiter or RateLimiter(), self.metrics)
         self.identitystore_id = identitystore_id
-        self.user_repository = {}
-        self.group_repository = {}
+        self.bulk_load_threshold = bulk_load_threshold
+        self._snapshot_repository = snapshot_repository
+        self.user_repository = PrincipalCache(max_cached_principals)
+        self.group_repository = PrincipalCache(max_cached_principals)
+        self.group_membership_repository = PrincipalCache(max_cached_principals)
+        self._group_membership_locks = {}
+        self._principal_lookup_locks = {}
+        self._repository_lock = threading.Lock()    # Repositories are shared between crawl threads
+        self._bulk_loaded_principal_types = set()
+        self._bulk_loaded_evictions = {}    # Evictions of the repository when its principal type was bulk loaded
+        self.principal_counts = dict(principal_counts or {})
+
+    def prefetch_principals(self, expected_principal_count: int, principal_type='ALL'):
+        """Decides between bulk loading and on-demand lookups of principal names
+        
+        A bulk load costs one identitystore:ListUsers/ListGroups call per 100 principals of the whole identitystore,
+        the on-demand lookup one identitystore:DescribeUser/DescribeGroup call per distinct resolved principal.
+        Bulk loads kept by the snapshot are always used since they cost no call. Otherwise the cheaper option is
+        chosen if the size of the identitystore is known from principal_counts, else bulk loading starts at
+        bulk_load_threshold expected principals.
+        Names missed by the bulk load are still resolved on demand.
+            
+        Parameters
+        -------
+        expected_principal_count : int
+          Number of distinct principals the caller expects to resolve
+        principal_type : string
+          Allowed values: 'USER', 'GROUP', 'ALL'
+        
+        Returns
+        -------
+        bulk_loaded : bool
+        """
+        if self.bulk_load_threshold is None:
+            logging.info(f'Resolving {expected_principal_count} expected principals on demand')
+            return False
+        self._forget_evicted_bulk_loads()
+        for snapshot_principal_type in self._get_principal_types(principal_type):
+            if snapshot_principal_type not in self._bulk_loaded_principal_types:
+                if self._load_principals_from_snapshot(snapshot_principal_type, self._get_repository(snapshot_principal_type)):
+                    self._mark_bulk_loaded(snapshot_principal_type)
+        bulk_load_pages = self.get_bulk_load_pages(principal_type)
+        if bulk_load_pages is None:
+            bulk_load = expected_principal_count >= self.bulk_load_threshold
+        else:
+            bulk_load = bulk_load_pages < expected_principal_count
+        if not bulk_load:
+            logging.info(f'Resolving {expected_principal_count} expected principals on demand, a bulk load needs {bulk_load_pages} pages')
+            return False
+        with self.metrics.phase('name_resolution'):
+            self.load_all_principals(principal_type)
+        return True
+
+    def get_bulk_load_pages(self, principal_type='ALL'):
+        """Returns the ListUsers/ListGroups calls load_all_principals still needs, None if the size of the identitystore is unknown"""
+        self._forget_evicted_bulk_loads()
+        bulk_load_pages = 0
+        for unloaded_principal_type in self._get_principal_types(principal_type):
+            if unloaded_principal_type in self._bulk_loaded_principal_types:
+                continue
+            if unloaded_principal_type not in self.principal_counts:
+                return None
+            bulk_load_pages += max(1, math.ceil(self.principal_counts[unloaded_principal_type] / self.BULK_LOAD_PAGE_SIZE))
+        return bulk_load_pages
+
+    @staticmethod
+    def _get_principal_types(principal_type: str):
+        return ['USER', 'GROUP'] if principal_type == 'ALL' else [principal_type]
+
+    def _get_repository(self, principal_type: str) -> PrincipalCache:
+        return self.user_repository if principal_type == 'USER' else self.group_repository
+
+    def _mark_bulk_loaded(self, principal_type: str):
+        with self._repository_lock:
+            self._bulk_loaded_principal_types.add(principal_type)
+            self._bulk_loaded_evictions[principal_type] = self._get_repository(principal_type).evictions
+
+    def _forget_evicted_bulk_loads(self):
+        """A bulk loaded principal type is incomplete again once on-demand lookups evicted some of its names"""
+        with self._repository_lock:
+            for principal_type in list(self._bulk_loaded_principal_types):
+                if self._get_repository(principal_type).evictions != self._bulk_loaded_evictions[principal_type]:
+                    logging.info(f'Bulk loaded principals of type {principal_type} got evicted, they are no longer complete')
+                    self._bulk_loaded_principal_types.discard(principal_type)
+
+    def load_all_principals(self, principal_type='ALL'):
+        """Loads the names of all users and/or groups of the identitystore into the local state
+    
+        Must be called within the management account where the identitystore is configured.
+        The caller must have permissions for identitystore:ListUsers and identitystore:ListGroups
+            
+        Parameters
+        -------
+        principal_type : string
+          Allowed values: 'USER', 'GROUP', 'ALL'
+            
+        Raises
+        ------
+        IdentityStore.Client.exceptions.ResourceNotFoundException
+        IdentityStore.Client.exceptions.ThrottlingException
+        IdentityStore.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.InternalServerException
+        IdentityStore.Client.exceptions.ValidationException
+        
+        
+        References
+        ----------
+        .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/identitystore/client/list_users.html
+        .. [2] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/identitystore/client/list_groups.html
+        """
+        if principal_type not in ['USER','GROUP','ALL']:
+            raise ValueError(f'principal_type must be one of "USER", "GROUP" or "ALL". Provided value {principal_type}')
+        self._forget_evicted_bulk_loads()
+        if principal_type in ['USER','ALL'] and 'USER' not in self._bulk_loaded_principal_types:
+            if self._load_principals_from_snapshot('USER', self.user_repository):
+                self._mark_bulk_loaded('USER')
+        if principal_type in ['USER','ALL'] and 'USER' not in self._bulk_loaded_principal_types:
+            logging.info(f'Calling identitystore:ListUsers API to retrieve all users of {self.identitystore_id}')
+            evictions = self.user_repository.evictions
+            user_page_iterator = self._identitystore_client.get_paginator('list_users').paginate(
+                IdentityStoreId=self.identitystore_id,
+                MaxResults=self.BULK_LOAD_PAGE_SIZE
+                )
+            for user_page in user_page_iterator:
+                with self._repository_lock:
+                    self.user_repository.update({user['UserId']: user['UserName'] for user in user_page['Users']})
+            if self._is_complete('USER', self.user_repository, evictions):
+                self._mark_bulk_loaded('USER')
+                if self._snapshot_repository:
+                    self._snapshot_repository.put('principals', 'USER', self.user_repository)
+        if principal_type in ['GROUP','ALL'] and 'GROUP' not in self._bulk_loaded_principal_types:
+            if self._load_principals_from_snapshot('GROUP', self.group_repository):
+                self._mark_bulk_loaded('GROUP')
+        if principal_type in ['GROUP','ALL'] and 'GROUP' not in self._bulk_loaded_principal_types:
+            logging.info(f'Calling identitystore:ListGroups API to retrieve all groups of {self.identitystore_id}')
+            evictions = self.group_repository.evictions
+            group_page_iterator = self._identitystore_client.get_paginator('list_groups').paginate(
+                IdentityStoreId=self.identitystore_id,
+                MaxResults=self.BULK_LOAD_PAGE_SIZE
+                )
+            for group_page in group_page_iterator:
+                with self._repository_lock:
+                    self.group_repository.update({group['GroupId']: group['DisplayName'] for group in group_page['Groups']})
+            if self._is_complete('GROUP', self.group_repository, evictions):
+                self._mark_bulk_loaded('GROUP')
+                if self._snapshot_repository:
+                    self._snapshot_repository.put('principals', 'GROUP', self.group_repository)
+
+    def _is_complete(self, principal_type: str, repository: PrincipalCache, evictions: int):
+        """Whether a bulk load kept all its principals. Otherwise evicted names are resolved on demand again"""
+        if repository.evictions == evictions:
+            self.principal_counts[principal_type] = len(repository)
+            return True
+        logging.warning(f'Bulk loaded principals of type {principal_type} exceed max_cached_principals {repository.max_size}, evicted names are resolved on demand')
+        return False
+
+    def get_bulk_loaded_principals(self, principal_type='ALL'):
+        """Returns (principal_type, principal_id) of all users and/or groups, None unless they were bulk loaded by load_all_principals"""
+        principal_types = self._get_principal_types(principal_type)
+        self._forget_evicted_bulk_loads()
+        if not self._bulk_loaded_principal_types.issuperset(principal_types):
+            return None
+        principals = []
+        with self._repository_lock:
+            if 'USER' in principal_types:
+                principals.extend(('USER', user_id) for user_id in self.user_repository)
+            if 'GROUP' in principal_types:
+                principals.extend(('GROUP', group_id) for group_id in self.group_repository)
+        return principals
+
+    def _load_principals_from_snapshot(self, principal_type: str, repository: dict):
+        """Fills a local repository from a bulk loaded snapshot entry. Returns False on a snapshot miss"""
+        if not self._snapshot_repository:
+            return False
+        cached_principals = self._snapshot_repository.get('principals', principal_type)
+        if cached_principals is None:
+            return False
+        logging.info(f'Loaded {len(cached_principals)} principals of type {principal_type} from snapshot')
+        evictions = repository.evictions
+        with self._repository_lock:
+            repository.update(cached_principals)
+        return self._is_complete(principal_type, repository, evictions)
+
+    def _get_principalname_from_snapshot(self, principal_type: str, principal_id: str):
+        """Returns a single principal name of the snapshot, None on a snapshot miss"""
+        if not self._snapshot_repository:
+            return None
+        return self._snapshot_repository.get('principals', f'{principal_type}|{principal_id}')
+
+    def _get_principalname_by_id(self, principal_type: str, principal_id: str, repository: PrincipalCache, describe_principal):
+        """Resolves a principal name through the local repository, the snapshot and the API in this order
+
+        Concurrent lookups of the same uncached principal are coalesced into a single API call, the other
+        callers wait for its result. Principals which no longer exist are cached with the name None.
+        """
+        with self._repository_lock:
+            cache_hit = principal_id in repository
+            if cache_hit:
+                principal_name = repository[principal_id]
+            else:
+                principal_lookup_lock = self._principal_lookup_locks.setdefault((principal_type, principal_id), threading.Lock())
+        self.metrics.record_cache(f'{principal_type.lower()}_repository', cache_hit)
+        if cache_hit:
+            return principal_name
+        try:
+            with principal_lookup_lock:    # Concurrent callers of the same principal wait for the first one
+                with self._repository_lock:
+                    coalesced = principal_id in repository
+                    if coalesced:
+                        principal_name = repository[principal_id]
+                self.metrics.record_cache('principal_lookup_coalescing', coalesced)
+                if coalesced:
+                    return principal_name
+                principal_name = self._get_principalname_from_snapshot(principal_type, principal_id)
+                if principal_name is None:
+                    principal_name = describe_principal(principal_id)
+                    if principal_name is not None and self._snapshot_repository:
+                        self._snapshot_repository.put('principals', f'{principal_type}|{principal_id}', principal_name)
+                with self._repository_lock:
+                    repository[principal_id] = principal_name
+                return principal_name
+        finally:
+            with self._repository_lock:
+                self._principal_lookup_locks.pop((principal_type, principal_id), None)
         
     def get_username_by_id(self, user_id:str):
         """Retrieves username by id
@@ -27,10 +271,10 @@ class IdentitystoreRepository:
         Returns
         -------
         username : str
+          None if the user no longer exists, e.g. a deleted user still referenced by an account assignment
             
         Raises
         ------
-        IdentityStore.Client.exceptions.ResourceNotFoundException
         IdentityStore.Client.exceptions.ThrottlingException
         IdentityStore.Client.exceptions.AccessDeniedException
         IdentityStore.Client.exceptions.InternalServerException
@@ -41,11 +285,19 @@ class IdentitystoreRepository:
         ----------
         .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/identitystore/client/describe_user.html
         """
-        if user_id not in self.user_repository.keys():
-            logging.info(f'Calling identitystore:DescribeUser for user id {user_id}')
-            user_object = self._identitystore_client.describe_user(IdentityStoreId=self.identitystore_id, UserId=user_id)
-            self.user_repository[user_id]=user_object['UserName']
-        return self.user_repository[user_id]
+        return self._get_principalname_by_id('USER', user_id, self.user_repository, self._describe_username)
+
+    def _describe_username(self, user_id: str):
+        logging.info(f'Calling identitystore:DescribeUser for user id {user_id}')
+        try:
+            with self.metrics.phase('name_resolution'):
+                user_object = self._identitystore_client.describe_user(IdentityStoreId=self.identitystore_id, UserId=user_id)
+        except ClientError as error:
+            if error.response.get('Error', {}).get('Code') != 'ResourceNotFoundException':
+                raise
+            logging.warning(f'User {user_id} does not exist anymore, its bindings are reported as orphaned')
+            return None
+        return user_object['UserName']
     
     def get_groupname_by_id(self, group_id: str):
         """Retrieves username by id
@@ -60,10 +312,10 @@ class IdentitystoreRepository:
         Returns
         -------
         groupname : str
+          None if the group no longer exists, e.g. a deleted group still referenced by an account assignment
             
         Raises
         ------
-        IdentityStore.Client.exceptions.ResourceNotFoundException
         IdentityStore.Client.exceptions.ThrottlingException
         IdentityStore.Client.exceptions.AccessDeniedException
         IdentityStore.Client.exceptions.InternalServerException
@@ -74,23 +326,187 @@ class IdentitystoreRepository:
         ----------
         .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/identitystore/client/describe_group.html
         """
-        if group_id not in self.group_repository.keys():
-            logging.info(f'Calling identitystore:DescribeGroup for group id {group_id}')
-            # {
-            #     'GroupId': 'string',
-            #     'DisplayName': 'string',
-            #     'ExternalIds': [
-            #         {
-            #             'Issuer': 'string',
-            #             'Id': 'string'
-            #         },
-            #     ],
-            #     'Description': 'string',
-            #     'IdentityStoreId': 'string'
-            # }
-            group_object = self._identitystore_client.describe_group(IdentityStoreId=self.identitystore_id, GroupId=group_id)
-            self.group_repository[group_id]=group_object['DisplayName']
-        return self.group_repository[group_id]
+        return self._get_principalname_by_id('GROUP', group_id, self.group_repository, self._describe_groupname)
+
+    def _describe_groupname(self, group_id: str):
+        logging.info(f'Calling identitystore:DescribeGroup for group id {group_id}')
+        # {
+        #     'GroupId': 'string',
+        #     'DisplayName': 'string',
+        #     'ExternalIds': [
+        #         {
+        #             'Issuer': 'string',
+        #             'Id': 'string'
+        #         },
+        #     ],
+        #     'Description': 'string',
+        #     'IdentityStoreId': 'string'
+        # }
+        try:
+            with self.metrics.phase('name_resolution'):
+                group_object = self._identitystore_client.describe_group(IdentityStoreId=self.identitystore_id, GroupId=group_id)
+        except ClientError as error:
+            if error.response.get('Error', {}).get('Code') != 'ResourceNotFoundException':
+                raise
+            logging.warning(f'Group {group_id} does not exist anymore, its bindings are reported as orphaned')
+            return None
+        return group_object['DisplayName']
+
+    def get_user_id_by_username(self, username: str):
+        """Resolves a username to its user id
+    
+        Must be called within the management account where the identitystore is configured.
+        The caller must have permissions for identitystore:GetUserId
+            
+        Parameters
+        -------
+        username : str
+        
+        Returns
+        -------
+        user_id : str
+            
+        Raises
+        ------
+        IdentityStore.Client.exceptions.ResourceNotFoundException
+        IdentityStore.Client.exceptions.ThrottlingException
+        IdentityStore.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.InternalServerException
+        IdentityStore.Client.exceptions.ValidationException
+        
+        
+        References
+        ----------
+        .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/identitystore/client/get_user_id.html
+        """
+        with self._repository_lock:
+            user_id = next((user_id for user_id, known_username in self.user_repository.items() if known_username == username), None)
+        if user_id is None:
+            logging.info(f'Calling identitystore:GetUserId for username {username}')
+            user_id = self._identitystore_client.get_user_id(
+                IdentityStoreId=self.identitystore_id,
+                AlternateIdentifier={'UniqueAttribute': {'AttributePath': 'userName', 'AttributeValue': username}}
+                )['UserId']
+            with self._repository_lock:
+                self.user_repository[user_id]=username
+        return user_id
+
+    def get_group_id_by_groupname(self, groupname: str):
+        """Resolves a group display name to its group id
+    
+        Must be called within the management account where the identitystore is configured.
+        The caller must have permissions for identitystore:GetGroupId
+            
+        Parameters
+        -------
+        groupname : str
         
+        Returns
+        -------
+        group_id : str
+            
+        Raises
+        ------
+        IdentityStore.Client.exceptions.ResourceNotFoundException
+        IdentityStore.Client.exceptions.ThrottlingException
+        IdentityStore.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.InternalServerException
+        IdentityStore.Client.exceptions.ValidationException
+        
+        
+        References
+        ----------
+        .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/identitystore/client/get_group_id.html
+        """
+        with self._repository_lock:
+            group_id = next((group_id for group_id, known_groupname in self.group_repository.items() if known_groupname == groupname), None)
+        if group_id is None:
+            logging.info(f'Calling identitystore:GetGroupId for group {groupname}')
+            group_id = self._identitystore_client.get_group_id(
+                IdentityStoreId=self.identitystore_id,
+                AlternateIdentifier={'UniqueAttribute': {'AttributePath': 'displayName', 'AttributeValue': groupname}}
+                )['GroupId']
+            with self._repository_lock:
+                self.group_repository[group_id]=groupname
+        return group_id
+
+    def get_member_ids_by_group_id(self, group_id: str):
+        """Retrieves the user ids of all members of a group, paging through its memberships only once per group
     
-    
\ No newline at end of file
+        Must be called within the management account where the identitystore is configured.
+        The caller must have permissions for identitystore:ListGroupMemberships
+            
+        Parameters
+        -------
+        group_id : str
+        
+        Returns
+        -------
+        user_ids : list(str)
+            
+        Raises
+        ------
+        IdentityStore.Client.exceptions.ResourceNotFoundException
+        IdentityStore.Client.exceptions.ThrottlingException
+        IdentityStore.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.InternalServerException
+        IdentityStore.Client.exceptions.ValidationException
+        
+        
+        References
+        ----------
+        .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/identitystore/client/list_group_memberships.html
+        """
+        with self._repository_lock:
+            cache_hit = group_id in self.group_membership_repository
+            if cache_hit:
+                member_ids = self.group_membership_repository[group_id]
+            else:
+                group_membership_lock = self._group_membership_locks.setdefault(group_id, threading.Lock())
+        self.metrics.record_cache('group_membership_repository', cache_hit)
+        if cache_hit:
+            return member_ids
+        try:
+            with group_membership_lock:    # Concurrent callers of the same group wait for the first one
+                with self._repository_lock:
+                    coalesced = group_id in self.group_membership_repository
+                    if coalesced:
+                        member_ids = self.group_membership_repository[group_id]
+                if coalesced:
+                    return member_ids
+                member_ids = self._snapshot_repository.get('group_memberships', group_id) if self._snapshot_repository else None
+                if member_ids is None:
+                    logging.info(f'Calling identitystore:ListGroupMemberships API to retrieve all members of group {group_id}')
+                    # {
+                    #     'GroupMemberships': [
+                    #         {
+                    #             'IdentityStoreId': 'string',
+                    #             'MembershipId': 'string',
+                    #             'GroupId': 'string',
+                    #             'MemberId': {
+                    #                 'UserId': 'string'
+                    #             }
+                    #         },
+                    #     ],
+                    #     'NextToken': 'string'
+                    # }
+                    with self.metrics.phase('name_resolution'):
+                        membership_page_iterator = self._identitystore_client.get_paginator('list_group_memberships').paginate(
+                            IdentityStoreId=self.identitystore_id,
+                            GroupId=group_id,
+                            MaxResults=100
+                            )
+                        member_ids = [
+                            group_membership['MemberId']['UserId']
+                            for membership_page in membership_page_iterator
+                            for group_membership in membership_page['GroupMemberships']
+                            if 'UserId' in group_membership.get('MemberId', {})
+                            ]
+                    if self._snapshot_repository:
+                        self._snapshot_repository.put('group_memberships', group_id, member_ids)
+                with self._repository_lock:
+                    self.group_membership_repository[group_id] = member_ids
+                return member_ids
+        finally:
+            with self._repository_lock:
+                self._group_membership_locks.pop(group_id, None)
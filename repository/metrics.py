@@ -0,0 +1,158 @@
+import bisect
+import collections
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+class Metrics:
+    LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+    def __init__(self):
+        """Call, latency, cache and phase metrics fed by all repositories
+
+        Example:
+            metrics = Metrics()
+            account_repository = AccountRepository(
+                boto3.client('organizations'),
+                metrics=metrics
+            )
+            print(metrics.to_prometheus())
+        """
+        self.api_calls = collections.Counter()
+        self.api_pages = collections.Counter()
+        self.api_errors = collections.Counter()
+        self.api_latency_sums = collections.Counter()
+        self.api_latency_buckets = collections.defaultdict(lambda: [0] * (len(self.LATENCY_BUCKETS) + 1))
+        self.cache_requests = collections.Counter()
+        self.phase_seconds = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record_api_call(self, operation_name: str, seconds: float, error_code=None):
+        """Records a single API request. Successful List* requests count as one page each"""
+        with self._lock:
+            self.api_calls[operation_name] += 1
+            self.api_latency_sums[operation_name] += seconds
+            self.api_latency_buckets[operation_name][bisect.bisect_left(self.LATENCY_BUCKETS, seconds)] += 1
+            if error_code:
+                self.api_errors[(operation_name, error_code)] += 1
+            elif operation_name.startswith('List'):
+                self.api_pages[operation_name] += 1
+
+    def count_api_calls(self, operation_names):
+        with self._lock:
+            return sum(self.api_calls[operation_name] for operation_name in operation_names)
+
+    def record_cache(self, cache_name: str, hit: bool):
+        with self._lock:
+            self.cache_requests[(cache_name, 'hit' if hit else 'miss')] += 1
+
+    def add_phase_seconds(self, phase_name: str, seconds: float):
+        with self._lock:
+            self.phase_seconds[phase_name] += seconds
+
+    @contextmanager
+    def phase(self, phase_name: str):
+        """Adds the duration of the block to a phase. Phases entered by several threads add up their thread time"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase_seconds(phase_name, time.perf_counter() - started_at)
+
+    def to_dict(self):
+        """
+        Returns
+        -------
+        metrics : dict
+          {
+            'api': {
+              'ListAccountAssignments': {
+                'calls': int,
+                'pages': int,
+                'errors': {'ThrottlingException': int},
+                'latency_seconds_sum': float,
+                'latency_seconds_buckets': {'0.005': int, ..., '+Inf': int}
+              }
+            },
+            'cache': {
+              'user_repository': {'hit': int, 'miss': int, 'hit_rate': float}
+            },
+            'phases_seconds': {'assignment_crawl': float}
+          }
+        """
+        with self._lock:
+            bucket_labels = [str(bucket) for bucket in self.LATENCY_BUCKETS] + ['+Inf']
+            api = {
+                operation_name: {
+                    'calls': calls,
+                    'pages': self.api_pages[operation_name],
+                    'errors': {error_code: errors for (error_operation_name, error_code), errors in self.api_errors.items() if error_operation_name == operation_name},
+                    'latency_seconds_sum': round(self.api_latency_sums[operation_name], 6),
+                    'latency_seconds_buckets': dict(zip(bucket_labels, itertools.accumulate(self.api_latency_buckets[operation_name])))
+                }
+                for operation_name, calls in sorted(self.api_calls.items())
+            }
+            cache = {}
+            for (cache_name, result), requests in sorted(self.cache_requests.items()):
+                cache.setdefault(cache_name, {'hit': 0, 'miss': 0})[result] = requests
+            for cache_counts in cache.values():
+                cache_counts['hit_rate'] = round(cache_counts['hit'] / (cache_counts['hit'] + cache_counts['miss']), 4)
+            return {
+                'api': api,
+                'cache': cache,
+                'phases_seconds': {phase_name: round(seconds, 6) for phase_name, seconds in self.phase_seconds.items()}
+            }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self):
+        """Renders all metrics in the Prometheus text exposition format"""
+        metrics = self.to_dict()
+        lines = [
+            '# HELP aws_api_calls_total API requests per operation, including retries',
+            '# TYPE aws_api_calls_total counter'
+        ]
+        lines += [f'aws_api_calls_total{{operation="{operation_name}"}} {api["calls"]}' for operation_name, api in metrics['api'].items()]
+        lines += [
+            '# HELP aws_api_pages_total Successful List* pages per operation',
+            '# TYPE aws_api_pages_total counter'
+        ]
+        lines += [f'aws_api_pages_total{{operation="{operation_name}"}} {api["pages"]}' for operation_name, api in metrics['api'].items() if operation_name.startswith('List')]
+        lines += [
+            '# HELP aws_api_errors_total Failed API requests per operation and error code',
+            '# TYPE aws_api_errors_total counter'
+        ]
+        lines += [
+            f'aws_api_errors_total{{operation="{operation_name}",code="{error_code}"}} {errors}'
+            for operation_name, api in metrics['api'].items()
+            for error_code, errors in api['errors'].items()
+        ]
+        lines += [
+            '# HELP aws_api_call_duration_seconds API request latency per operation',
+            '# TYPE aws_api_call_duration_seconds histogram'
+        ]
+        for operation_name, api in metrics['api'].items():
+            lines += [
+                f'aws_api_call_duration_seconds_bucket{{operation="{operation_name}",le="{bucket_label}"}} {requests}'
+                for bucket_label, requests in api['latency_seconds_buckets'].items()
+            ]
+            lines.append(f'aws_api_call_duration_seconds_sum{{operation="{operation_name}"}} {api["latency_seconds_sum"]}')
+            lines.append(f'aws_api_call_duration_seconds_count{{operation="{operation_name}"}} {api["calls"]}')
+        lines += [
+            '# HELP cache_requests_total Cache lookups per cache and result',
+            '# TYPE cache_requests_total counter'
+        ]
+        lines += [
+            f'cache_requests_total{{cache="{cache_name}",result="{result}"}} {cache_counts[result]}'
+            for cache_name, cache_counts in metrics['cache'].items()
+            for result in ['hit', 'miss']
+        ]
+        lines += [
+            '# HELP phase_duration_seconds Time spent per phase',
+            '# TYPE phase_duration_seconds gauge'
+        ]
+        lines += [f'phase_duration_seconds{{phase="{phase_name}"}} {seconds}' for phase_name, seconds in metrics['phases_seconds'].items()]
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,40 @@
+import collections
+
+class PrincipalCache(dict):
+    def __init__(self, max_size=None):
+        """Principal names or group memberships by id, evicting the least recently used entry beyond max_size entries
+
+        Lookups with [] mark an entry as recently used. None as max_size keeps every entry without
+        tracking its use, the cache then takes no more memory than a plain dict.
+        A name of None caches a principal which no longer exists in the identitystore.
+
+        Example:
+            user_repository = PrincipalCache(max_size=50000)
+            user_repository.update({'906734e6-0001-7049-4e3c-8f5e1f2bd8a0': 'jdoe'})
+        """
+        super().__init__()
+        self.max_size = max_size
+        self.evictions = 0
+        self._recency = collections.OrderedDict() if max_size is not None else None
+
+    def __getitem__(self, principal_id):
+        principal_name = super().__getitem__(principal_id)
+        if self._recency is not None:
+            self._recency.move_to_end(principal_id)
+        return principal_name
+
+    def __setitem__(self, principal_id, principal_name):
+        super().__setitem__(principal_id, principal_name)
+        if self._recency is None:
+            return
+        self._recency[principal_id] = None
+        self._recency.move_to_end(principal_id)
+        if len(self) > self.max_size:
+            least_recently_used_id, _ = self._recency.popitem(last=False)
+            super().__delitem__(least_recently_used_id)
+            self.evictions += 1
+
+    def update(self, principal_names):
+        """Adds entries one by one, dict.update would bypass the eviction"""
+        for principal_id, principal_name in principal_names.items():
+            self[principal_id] = principal_name
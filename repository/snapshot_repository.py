@@ -0,0 +1,90 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+class SnapshotRepository:
+    DEFAULT_TTLS = {
+        'instances': 24 * 3600,
+        'accounts': 24 * 3600,
+        'permissionsets': 3600,
+        'account_assignments': 3600,
+        'principals': 24 * 3600,
+        'group_memberships': 3600
+    }
+
+    def __init__(self, database_path: str, ttls=None, metrics=None):
+        """Local SQLite snapshot of the assignment graph, read through by the other repositories
+
+        Every entity type expires after its own TTL in seconds. Payloads are stored as JSON,
+        datetimes are therefore returned as ISO formatted strings after a cache hit.
+        Hits and misses are recorded per entity type in the optional Metrics.
+
+        Example:
+            snapshot_repository = SnapshotRepository(
+                'assignments.sqlite',
+                {'account_assignments': 900}
+            )
+        """
+        self.database_path = database_path
+        self.ttls = {**self.DEFAULT_TTLS, **(ttls or {})}
+        self._metrics = metrics
+        # The file may be shared by several shard processes, wait for their write locks instead of failing
+        self._connection = sqlite3.connect(database_path, timeout=60, check_same_thread=False)
+        self._connection_lock = threading.Lock()    # The connection is shared between crawl threads
+        # Every put commits on its own, the write-ahead log turns each commit into an append without a sync.
+        # A crash may lose the last puts, which are simply fetched again, but never corrupts the snapshot
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        with self._connection_lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS snapshot ('
+                '  entity_type TEXT NOT NULL,'
+                '  entity_key TEXT NOT NULL,'
+                '  payload TEXT NOT NULL,'
+                '  stored_at REAL NOT NULL,'
+                '  PRIMARY KEY (entity_type, entity_key)'
+                ')'
+            )
+
+    def get(self, entity_type: str, entity_key: str):
+        """Returns the stored payload or None if it is missing or older than the TTL of its entity type"""
+        with self._connection_lock:
+            row = self._connection.execute(
+                'SELECT payload, stored_at FROM snapshot WHERE entity_type = ? AND entity_key = ?',
+                (entity_type, entity_key)
+            ).fetchone()
+        if row is None:
+            self._record_cache(entity_type, False)
+            return None
+        payload, stored_at = row
+        if time.time() - stored_at > self.ttls.get(entity_type, 0):
+            logging.info(f'Snapshot entry {entity_type}:{entity_key} expired')
+            self._record_cache(entity_type, False)
+            return None
+        self._record_cache(entity_type, True)
+        return json.loads(payload)
+
+    def _record_cache(self, entity_type: str, hit: bool):
+        if self._metrics is not None:
+            self._metrics.record_cache(f'snapshot_{entity_type}', hit)
+
+    def put(self, entity_type: str, entity_key: str, payload):
+        with self._connection_lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO snapshot (entity_type, entity_key, payload, stored_at) VALUES (?, ?, ?, ?)',
+                (entity_type, entity_key, json.dumps(payload, default=str), time.time())
+            )
+
+    def invalidate(self, entity_type=None):
+        """Drops all entries or only the ones of a single entity type"""
+        with self._connection_lock, self._connection:
+            if entity_type is None:
+                self._connection.execute('DELETE FROM snapshot')
+            else:
+                self._connection.execute('DELETE FROM snapshot WHERE entity_type = ?', (entity_type,))
+
+    def close(self):
+        with self._connection_lock:
+            self._connection.close()
@@ -1,10 +1,40 @@
 import itertools
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from repository.assignment_graph import AssignmentGraph
 from repository.identitystore_repository import IdentitystoreRepository
+from repository.metrics import Metrics
+from repository.rate_limiter import RateLimitedClient, RateLimiter
 
 class SsoAdminRepository:
-    def __init__(self, boto3_ssoadmin_client, boto3_identitystore_client, sso_admin_instance=None):
+    CRAWL_PLANS = ['account-first', 'permission-set-first', 'principal-first']
+    # Provisioned permissionsets per account assumed by plan_crawl while the permissionsets are not loaded
+    ESTIMATED_PERMISSIONSETS_PER_ACCOUNT = 5
+    # API operations whose calls are estimated by plan_crawl
+    PLANNED_OPERATIONS = [
+        'ListPermissionSetsProvisionedToAccount',
+        'ListAccountsForProvisionedPermissionSet',
+        'DescribePermissionSet',
+        'ListAccountAssignments',
+        'ListAccountAssignmentsForPrincipal',
+        'ListUsers',
+        'ListGroups'
+    ]
+
+    PERMISSIONSET_METADATA_KEYS = ['Name', 'Description', 'CreatedDate', 'SessionDuration', 'RelayState']
+
+    def __init__(self, boto3_ssoadmin_client, boto3_identitystore_client, sso_admin_instance=None, snapshot_repository=None, rate_limiter=None, metrics=None, checkpoint_journal=None,
+                 max_cached_principals=None, describe_permissionsets=True, principal_counts=None):
         '''
+        snapshot_repository: Optional SnapshotRepository permissionsets, account assignments and principal names are read through
+        checkpoint_journal: Optional CheckpointJournal completed account/permissionset units are recorded in and resumed from
+        max_cached_principals: Optional size limit of the principal caches of the identitystore repository
+        describe_permissionsets: False only keeps Name and PermissionSetArn of every loaded permissionset
+        principal_counts: Optional known number of users and groups of the identitystore, see IdentitystoreRepository
+        rate_limiter: Optional RateLimiter shared with the identitystore repository and the other repositories
+        metrics: Optional Metrics shared with the identitystore repository and the other repositories
         Example:
             sso_admin_client = boto3.client('sso-admin')
             identitystore_client = boto3.client('identitystore')
@@ -15,16 +45,31 @@ class SsoAdminRepository:
                 instance
             )
         '''
-        self._ssoadmin_client = boto3_ssoadmin_client
+        if rate_limiter is None:
+            rate_limiter = RateLimiter()
+        self.metrics = metrics or Metrics()
+        self._ssoadmin_client = RateLimitedClient(boto3_ssoadmin_client, rate_limiter, self.metrics)
+        self._snapshot_repository = snapshot_repository
+        self._checkpoint_journal = checkpoint_journal
         if not sso_admin_instance:
             sso_admin_instance = self._get_first_instance()
         self.instance_arn = sso_admin_instance['InstanceArn']
         self.identitystore_id = sso_admin_instance['IdentityStoreId']
         self.identitystore_repository = IdentitystoreRepository(
                 boto3_identitystore_client,
-                self.identitystore_id
+                self.identitystore_id,
+                snapshot_repository=snapshot_repository,
+                rate_limiter=rate_limiter,
+                metrics=self.metrics,
+                max_cached_principals=max_cached_principals,
+                principal_counts=principal_counts
             )
+        self.describe_permissionsets = describe_permissionsets
         self.permissionsets = []
+        self.permissionsets_by_arn = {}
+        self.permissionsets_by_account_id = {}
+        self._permissionset_lock = threading.Lock()
+        self._permissionsets_load_lock = threading.Lock()
         
     def _get_first_instance(self):
         """Initializes the SSO Instance with the first Instance found
@@ -61,12 +106,26 @@ class SsoAdminRepository:
         #     ],
         #     'NextToken': 'string'
         # }
+        if self._snapshot_repository:
+            cached_instance = self._snapshot_repository.get('instances', 'first')
+            if cached_instance is not None:
+                return cached_instance
         instances = self._ssoadmin_client.list_instances()
-        return instances.get('Instances',[{'InstanceArn':''}])[0]
+        instance = instances.get('Instances',[{'InstanceArn':''}])[0]
+        if self._snapshot_repository:
+            self._snapshot_repository.put('instances', 'first', instance)
+        return instance
     
-    def load_all_permissionsets(self):
+    def load_all_permissionsets(self, use_snapshot=True, max_workers=10):
         """Initializes all permissionsets into the local state
         
+        Parameters
+        -------
+        use_snapshot : bool
+          False bypasses the snapshot and reloads the permissionsets from the API
+        max_workers : int
+          Upper bound of concurrently loaded permissionsets
+        
         Returns
         -------
         instance : dict
@@ -97,6 +156,57 @@ class SsoAdminRepository:
         ----------
         .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sso-admin/client/list_permission_set.html
         """
+        for _ in self.iter_permissionsets(use_snapshot, max_workers):
+            pass
+        return self.permissionsets
+
+    def iter_permissionsets(self, use_snapshot=True, max_workers=10):
+        """Loads all permissionsets like load_all_permissionsets and yields every permissionset as soon as it is ready
+
+        The accounts and the description of up to max_workers permissionsets are retrieved concurrently,
+        permissionsets are yielded in the order they complete. Once the iterator is exhausted the local
+        state holds all permissionsets, ordered like ssoadmin:ListPermissionSets.
+
+        Example:
+            for permissionset in ssoadmin_repository.iter_permissionsets(max_workers=16):
+                print(f"{permissionset['Name']} is provisioned to {len(permissionset['AccountIds'])} accounts")
+        """
+        if self._snapshot_repository and use_snapshot:
+            cached_permissionsets = self._snapshot_repository.get('permissionsets', self.instance_arn)
+            if cached_permissionsets is not None:
+                logging.info(f'Loaded {len(cached_permissionsets)} permissionsets from snapshot')
+                self.permissionsets = cached_permissionsets
+                self._index_permissionsets()
+                yield from self.permissionsets
+                return
+        permission_set_arns = self._list_permissionset_arns()
+        loaded_permissionsets_by_arn = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            load_futures = [executor.submit(self._load_permissionset, permission_set_arn) for permission_set_arn in permission_set_arns]
+            for load_future in as_completed(load_futures):
+                permissionset = load_future.result()
+                loaded_permissionsets_by_arn[permissionset['PermissionSetArn']] = permissionset
+                logging.info(f'Loaded {len(loaded_permissionsets_by_arn)} of {len(permission_set_arns)} permissionsets')
+                yield permissionset
+        self.permissionsets = [loaded_permissionsets_by_arn[permission_set_arn] for permission_set_arn in permission_set_arns]
+        self._index_permissionsets()
+        if self._snapshot_repository and self.describe_permissionsets:    # A later run may need the full descriptions
+            self._snapshot_repository.put('permissionsets', self.instance_arn, self.permissionsets)
+
+    def _load_permissionset(self, permission_set_arn: str):
+        with self.metrics.phase('permissionset_load'):
+            account_ids = self._get_account_ids_by_permissionset(permission_set_arn)
+            logging.info(f'Calling ssoadmin:DescribePermissionSet API to retrieve all information for permissionset {permission_set_arn}')
+            permissionset = self._ssoadmin_client.describe_permission_set(InstanceArn=self.instance_arn,PermissionSetArn=permission_set_arn).get('PermissionSet')
+        if not self.describe_permissionsets:
+            # DescribePermissionSet is the only source of the name, only the attributes of the bindings are kept
+            permissionset = {'Name': permissionset['Name'], 'PermissionSetArn': permissionset['PermissionSetArn']}
+        return {
+            'AccountIds': account_ids,
+            **permissionset
+        }
+
+    def _list_permissionset_arns(self):
         paginator =  self._ssoadmin_client.get_paginator('list_permission_sets')
         list_permission_sets_parameters = {
             'InstanceArn': self.instance_arn,
@@ -104,17 +214,40 @@ class SsoAdminRepository:
         }
         logging.info(f'Calling ssoadmin:ListPermissionSets API to retrieve all permissionsets')
         permissionset_page_iterator = paginator.paginate(**list_permission_sets_parameters)
-        permission_set_arns = list(itertools.chain(
+        return list(itertools.chain(
             *[permissionset_page['PermissionSets'] for permissionset_page in permissionset_page_iterator]
             ))
+
+    def _index_permissionsets(self):
+        """Builds the permissionset ARN and account id lookup indexes from the local state"""
+        self.permissionsets_by_arn = {}
+        self.permissionsets_by_account_id = {}
+        for permissionset in self.permissionsets:
+            self.permissionsets_by_arn[permissionset['PermissionSetArn']] = permissionset
+            for account_id in permissionset['AccountIds']:
+                self.permissionsets_by_account_id.setdefault(account_id, []).append(permissionset)
+
+    def _ensure_permissionsets_loaded(self):
+        """Loads the permissionsets once, also while several threads ask for them before they are loaded"""
+        with self._permissionsets_load_lock:
+            if (self.permissionsets == []):
+                self.load_all_permissionsets()
+
+    def get_permissionset_by_arn(self, permission_set_arn: str):
+        """Returns the loaded permissionset with the given ARN or None if it is unknown"""
+        self._ensure_permissionsets_loaded()
+        return self.permissionsets_by_arn.get(permission_set_arn)
+
+    def get_permissionsets_by_account_id(self, account_id: str):
+        """Returns all loaded permissionsets which are provisioned to the given account
         
-        for permission_set_arn in permission_set_arns:
-            logging.info(f'Calling ssoadmin:DescribePermissionSet API to retrieve all information for permissionset {permission_set_arn}')
-            self.permissionsets.append({
-                'AccountIds': self._get_account_ids_by_permissionset(permission_set_arn),
-                **self._ssoadmin_client.describe_permission_set(InstanceArn=self.instance_arn,PermissionSetArn=permission_set_arn).get('PermissionSet')
-            })
-        return self.permissionsets
+        Returns
+        -------
+        permissionsets : list(dict)
+          Items are shaped like the ones of load_all_permissionsets
+        """
+        self._ensure_permissionsets_loaded()
+        return self.permissionsets_by_account_id.get(account_id, [])
 
     def _get_account_ids_by_permissionset(self, permission_set_arn):
         """Retrieves all accountid´s where the requested permission_set is linked
@@ -146,7 +279,8 @@ class SsoAdminRepository:
         logging.info(f'Calling ssoadmin:ListAccountsForProvisionedPermissionSet API to retrieve accounts for {permission_set_arn}')
         list_accounts_for_permission_set_page = self._ssoadmin_client.list_accounts_for_provisioned_permission_set(
             InstanceArn=self.instance_arn,
-            PermissionSetArn=permission_set_arn
+            PermissionSetArn=permission_set_arn,
+            MaxResults=100
             )
         account_ids.extend(list_accounts_for_permission_set_page['AccountIds'])
         
@@ -155,12 +289,13 @@ class SsoAdminRepository:
             list_accounts_for_permission_set_page = self._ssoadmin_client.list_accounts_for_provisioned_permission_set(
                 InstanceArn=self.instance_arn,
                 PermissionSetArn=permission_set_arn,
+                MaxResults=100,
                 NextToken= list_accounts_for_permission_set_page['NextToken']
                 )
             account_ids.extend(list_accounts_for_permission_set_page['AccountIds'])
         return account_ids
     
-    def _get_bindings_by_permissionset(self, account_id: str, permission_set_arn: str, principal_type='USER'):
+    def _get_bindings_by_permissionset(self, account_id: str, permission_set_arn: str, principal_type='USER', use_snapshot=True):
         """Retrives the user ID and Name linked to an account with a specific permission_set
         Parameters
         -------
@@ -168,6 +303,8 @@ class SsoAdminRepository:
         permission_set_arn: string
         principal_type : string
           Allowed values: 'USER', 'GROUP', 'ALL'
+        use_snapshot : bool
+          False bypasses the snapshot and the checkpoint journal and reloads the assignments from the API
         
         Returns
         -------
@@ -175,7 +312,8 @@ class SsoAdminRepository:
           [{
             'PrincipalType':'USER', 
             'Id':'string',
-            'Name':'string'
+            'Name':'string',
+            'Orphaned': True    # Only present for principals which no longer exist, their Name is None
           }]
             
         Raises
@@ -198,6 +336,81 @@ class SsoAdminRepository:
         """
         if principal_type not in ['USER','GROUP','ALL']:
             raise ValueError(f'principal_type must be one of "USER", "GROUP" or "ALL". Provided value {principal_type}')
+        if self._checkpoint_journal and use_snapshot:
+            completed_bindings = self._checkpoint_journal.get(account_id, permission_set_arn, principal_type)
+            if completed_bindings is not None:
+                return completed_bindings
+        bindings = self._classify_account_assignments(self._get_account_assignments(account_id, permission_set_arn, use_snapshot), principal_type)
+        if self._checkpoint_journal:
+            self._checkpoint_journal.record(account_id, permission_set_arn, principal_type, bindings)
+        return bindings
+
+    def _classify_account_assignments(self, all_account_assignments, principal_type='ALL'):
+        """Resolves the USER and GROUP bindings of raw account assignments in a single pass, users before groups"""
+        userbindings = []
+        groupbindings = []
+        for account_assignment in all_account_assignments:
+            if account_assignment['PrincipalType'] == 'USER' and principal_type in ['USER','ALL']:
+                userbindings.append(self._to_binding(
+                    'USER',
+                    account_assignment['PrincipalId'],
+                    self.identitystore_repository.get_username_by_id(account_assignment['PrincipalId'])
+                ))
+            elif account_assignment['PrincipalType'] == 'GROUP' and principal_type in ['GROUP','ALL']:
+                groupbindings.append(self._to_binding(
+                    'GROUP',
+                    account_assignment['PrincipalId'],
+                    self.identitystore_repository.get_groupname_by_id(account_assignment['PrincipalId'])
+                ))
+        return userbindings + groupbindings
+
+    @staticmethod
+    def _to_binding(principal_type: str, principal_id: str, principal_name):
+        """Principals which no longer exist in the identitystore are marked with 'Orphaned': True and have no name"""
+        binding = {'PrincipalType': principal_type, 'Id': principal_id, 'Name': principal_name}
+        if principal_name is None:
+            binding['Orphaned'] = True
+        return binding
+    
+    
+    def _get_account_assignments(self, account_id: str, permission_set_arn: str, use_snapshot=True):
+        """Retrieves all raw account assignments of an account with a specific permission_set
+        
+        Parameters
+        -------
+        account_id : string
+        permission_set_arn: string
+        use_snapshot : bool
+          False bypasses the snapshot and reloads the assignments from the API
+        
+        Returns
+        -------
+        account_assignments : list(dict)
+          [{
+            'AccountId': 'string',
+            'PermissionSetArn': 'string',
+            'PrincipalType': 'USER'|'GROUP',
+            'PrincipalId': 'string'
+          }]
+            
+        Raises
+        ------
+        SSOAdmin.Client.exceptions.ResourceNotFoundException
+        SSOAdmin.Client.exceptions.InternalServerException
+        SSOAdmin.Client.exceptions.ThrottlingException
+        SSOAdmin.Client.exceptions.ValidationException
+        SSOAdmin.Client.exceptions.AccessDeniedException
+        
+        
+        References
+        ----------
+        .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sso-admin/client/list_account_assignments.html
+        """
+        snapshot_key = f'{account_id}|{permission_set_arn}'
+        if self._snapshot_repository and use_snapshot:
+            cached_account_assignments = self._snapshot_repository.get('account_assignments', snapshot_key)
+            if cached_account_assignments is not None:
+                return cached_account_assignments
         all_account_assignments = []
         # Returns
         # {
@@ -229,37 +442,19 @@ class SsoAdminRepository:
                 NextToken= list_account_assignments_page['NextToken']
                 )
             all_account_assignments.extend(list_account_assignments_page['AccountAssignments'])
-        if principal_type=='USER':
-            return self._get_userbindings_by_permissionset(all_account_assignments)
-        if principal_type=='GROUP':
-            return self._get_groupbindings_by_permissionset(all_account_assignments)
-        if principal_type=='ALL':
-            return self._get_userbindings_by_permissionset(all_account_assignments) + self._get_groupbindings_by_permissionset(all_account_assignments)
-            
-    
-    def _get_userbindings_by_permissionset(self, all_account_assignments):
-        account_user_assignments = [account_assignment for account_assignment in all_account_assignments if account_assignment['PrincipalType'] == 'USER']
-        return [{
-            'PrincipalType':'USER', 
-            'Id':user['PrincipalId'],
-            'Name':self.identitystore_repository.get_username_by_id(user['PrincipalId'])
-        } for user in account_user_assignments]
-    
-    def _get_groupbindings_by_permissionset(self, all_account_assignments):
-        account_group_assignments = [account_assignment for account_assignment in all_account_assignments if account_assignment['PrincipalType'] == 'GROUP']
-        return [{
-            'PrincipalType':'GROUP', 
-            'Id':group['PrincipalId'],
-            'Name':self.identitystore_repository.get_groupname_by_id(group['PrincipalId'])
-        } for group in account_group_assignments]
-
-    def get_bindings_by_account_id(self, account_id, pricipal_type='USER'):
+        if self._snapshot_repository:
+            self._snapshot_repository.put('account_assignments', snapshot_key, all_account_assignments)
+        return all_account_assignments
+
+    def get_bindings_by_account_id(self, account_id, principal_type='USER', pricipal_type=None):
         """Delivers an overview about all assigned permissionset and the users assigned to a specific account
         Parameters
         -------
         account_id : string
         principal_type : string
           Allowed values: 'USER', 'GROUP', 'ALL'
+        pricipal_type : string
+          Deprecated spelling of principal_type, still accepted for existing callers
         
         Returns
         -------
@@ -270,7 +465,8 @@ class SsoAdminRepository:
             'attached_users': [{
               'PrincipalType':'USER', 
               'Id':'string',
-              'Name':'string'
+              'Name':'string',
+              'Orphaned': True    # Only present for principals which no longer exist, their Name is None
             }]
           }]
             
@@ -291,14 +487,13 @@ class SsoAdminRepository:
         ----------
         .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sso-admin/client/list_account_assignments.html
         """
-        if (self.permissionsets == []):
-            self.load_all_permissionsets()
+        if pricipal_type is not None:
+            principal_type = pricipal_type
         userbindings = []
-        active_permissionsets = [permissionset for permissionset in self.permissionsets if account_id in permissionset['AccountIds']]
-        for permissionset in active_permissionsets:
+        for permissionset in self.get_permissionsets_by_account_id(account_id):
             permissionset_arn = permissionset['PermissionSetArn']
             permissionset_name = permissionset['Name']
-            permissionset_userbindings = self._get_bindings_by_permissionset(account_id, permissionset_arn, principal_type='USER')
+            permissionset_userbindings = self._get_bindings_by_permissionset(account_id, permissionset_arn, principal_type=principal_type)
             if permissionset_userbindings:
                 userbindings.append({
                     'permission_set_arn':permissionset_arn,
@@ -306,3 +501,859 @@ class SsoAdminRepository:
                     'attached_users': permissionset_userbindings
                     })
         return userbindings
+
+    def get_bindings_for_accounts(self, account_ids, max_workers=10, principal_type='USER'):
+        """Delivers the bindings of several accounts by crawling all (account, permissionset) pairs in parallel
+        Parameters
+        -------
+        account_ids : list(string)
+        max_workers : int
+          Upper bound of concurrent ssoadmin:ListAccountAssignments crawls
+        principal_type : string
+          Allowed values: 'USER', 'GROUP', 'ALL'
+        
+        Returns
+        -------
+        bindings : dict
+          Ordered like account_ids, every value is shaped like the result of get_bindings_by_account_id
+          {
+            'string': [{
+              'permission_set_arn':'string',
+              'permission_set_name':'string',
+              'attached_users': [{
+                'PrincipalType':'USER', 
+                'Id':'string',
+                'Name':'string'
+              }]
+            }]
+          }
+            
+        Raises
+        ------
+        SSOAdmin.Client.exceptions.ResourceNotFoundException
+        SSOAdmin.Client.exceptions.InternalServerException
+        SSOAdmin.Client.exceptions.ThrottlingException
+        SSOAdmin.Client.exceptions.ValidationException
+        SSOAdmin.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.ResourceNotFoundException
+        IdentityStore.Client.exceptions.ThrottlingException
+        IdentityStore.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.InternalServerException
+        IdentityStore.Client.exceptions.ValidationException
+        
+        References
+        ----------
+        .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sso-admin/client/list_account_assignments.html
+        """
+        if (self.permissionsets == []):
+            return self._to_bindings(account_ids, *self._crawl_while_loading_permissionsets(account_ids, principal_type, max_workers))
+        crawl_units = [
+            (account_id, permissionset)
+            for account_id in account_ids
+            for permissionset in self.get_permissionsets_by_account_id(account_id)
+            ]
+        # Distinct principals are unknown before the crawl, the pair count is only a rough proxy:
+        # every pair carries at least one assignment, but principals repeat across pairs
+        self.identitystore_repository.prefetch_principals(self._count_pending_pairs(
+            [(account_id, permissionset['PermissionSetArn']) for account_id, permissionset in crawl_units], principal_type
+            ), principal_type)
+        return self._to_bindings(account_ids, crawl_units, self._crawl(crawl_units, principal_type, max_workers))
+
+    def _crawl_while_loading_permissionsets(self, account_ids, principal_type='USER', max_workers=10):
+        """Crawls the accounts of every permissionset as soon as iter_permissionsets delivers it
+
+        Loading and crawling share max_workers, so at most max(2, max_workers) sso-admin calls are in flight
+        and the connection pool of the client is not exceeded.
+        Returns the crawl units ordered like get_bindings_for_accounts and their results
+        """
+        # The pairs are unknown before all permissionsets are loaded, the planner estimate of the pairs stands in
+        # for the distinct principals like in get_bindings_for_accounts
+        requested_account_ids = set(account_ids)
+        completed_pair_count = sum(1 for account_id, _ in self._get_completed_pairs(principal_type) if account_id in requested_account_ids)
+        self.identitystore_repository.prefetch_principals(
+            max(0, len(account_ids) * self.ESTIMATED_PERMISSIONSETS_PER_ACCOUNT - completed_pair_count), principal_type
+            )
+        load_workers = max(1, max_workers // 2)
+        crawl_futures = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers - load_workers)) as executor:
+            for permissionset in self.iter_permissionsets(max_workers=load_workers):
+                for account_id in requested_account_ids.intersection(permissionset['AccountIds']):
+                    crawl_futures[(account_id, permissionset['PermissionSetArn'])] = executor.submit(
+                        self._get_bindings_by_permissionset, account_id, permissionset['PermissionSetArn'], principal_type
+                        )
+            logging.info(f'Crawling {len(crawl_futures)} account/permissionset pairs with {max_workers} workers while loading permissionsets')
+            crawl_units = [
+                (account_id, permissionset)
+                for account_id in account_ids
+                for permissionset in self.get_permissionsets_by_account_id(account_id)
+                ]
+            return crawl_units, [crawl_futures[(account_id, permissionset['PermissionSetArn'])].result() for account_id, permissionset in crawl_units]
+
+    def _get_completed_pairs(self, principal_type: str):
+        """(account_id, permission_set_arn) pairs served by the checkpoint journal, which need no principal names"""
+        if not self._checkpoint_journal:
+            return set()
+        return self._checkpoint_journal.get_completed_units(principal_type)
+
+    def _count_pending_pairs(self, pairs, principal_type: str):
+        completed_pairs = self._get_completed_pairs(principal_type)
+        return sum(1 for pair in pairs if pair not in completed_pairs)
+
+    def _to_bindings(self, account_ids, crawl_units, crawl_results, principal_filter=None):
+        """Groups crawl results by account. principal_filter optionally limits them to a set of (principal_type, principal_id)"""
+        bindings = {account_id: [] for account_id in account_ids}
+        for (account_id, permissionset), permissionset_bindings in zip(crawl_units, crawl_results):
+            if principal_filter is not None:
+                permissionset_bindings = [principal for principal in permissionset_bindings if (principal['PrincipalType'], principal['Id']) in principal_filter]
+            if permissionset_bindings:
+                bindings[account_id].append(self._to_account_binding(permissionset, permissionset_bindings))
+        return bindings
+
+    def _crawl(self, crawl_units, principal_type='USER', max_workers=10, use_snapshot=True):
+        """Resolves the bindings of (account_id, permissionset) pairs in parallel. Results are ordered like crawl_units"""
+        logging.info(f'Crawling {len(crawl_units)} account/permissionset pairs with {max_workers} workers')
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            crawl_futures = [
+                executor.submit(self._get_bindings_by_permissionset, account_id, permissionset['PermissionSetArn'], principal_type, use_snapshot)
+                for account_id, permissionset in crawl_units
+                ]
+            return [crawl_future.result() for crawl_future in crawl_futures]
+
+    def plan_crawl(self, account_ids, permission_set_arns=None, principals=None, principal_type='USER'):
+        """Estimates the API calls of every crawl plan from metadata at hand
+        
+        account-first lists the permissionsets provisioned to every account, unless the permissionsets are loaded,
+        and crawls every account/permissionset pair. permission-set-first loads the selected permissionsets with
+        their accounts and crawls the pairs within account_ids. principal-first lists all principals of
+        principal_type, unless they are loaded, and the assignments of every principal with
+        ssoadmin:ListAccountAssignmentsForPrincipal.
+        Without loaded permissionsets every account is assumed to carry ESTIMATED_PERMISSIONSETS_PER_ACCOUNT
+        of the selected permissionsets. The principal listing of principal-first is estimated from the known size
+        of the identitystore. The name lookups of the other plans are not estimated. Estimating makes no call
+        besides ssoadmin:ListPermissionSets when the permissionsets are not loaded.
+        
+        Parameters
+        -------
+        account_ids : list(string)
+        permission_set_arns : list(string)
+          Optional, only these permissionsets are crawled
+        principals : list(tuple)
+          Optional (principal_type, principal_id) pairs, only these principals are crawled
+        principal_type : string
+          Allowed values: 'USER', 'GROUP', 'ALL'. Ignored if principals are given
+        
+        Returns
+        -------
+        estimates : dict
+          Estimated API calls per plan, cheapest first. None if a plan can not be estimated:
+          principal-first needs principals, loaded principals or the size of the identitystore
+          {
+            'account-first': int,
+            'permission-set-first': int,
+            'principal-first': None
+          }
+        """
+        return self._estimate_plans(account_ids, self._select_permissionset_arns(permission_set_arns), principals, principal_type)
+
+    def _select_permissionset_arns(self, permission_set_arns=None):
+        if permission_set_arns is not None:
+            return list(dict.fromkeys(permission_set_arns))
+        if self.permissionsets:
+            return [permissionset['PermissionSetArn'] for permissionset in self.permissionsets]
+        return self._list_permissionset_arns()
+
+    def _estimate_pair_count(self, account_ids, selected_arns):
+        if self.permissionsets:
+            account_id_set = set(account_ids)
+            return sum(
+                1
+                for permission_set_arn in selected_arns if permission_set_arn in self.permissionsets_by_arn
+                for account_id in self.permissionsets_by_arn[permission_set_arn]['AccountIds'] if account_id in account_id_set
+                )
+        return len(account_ids) * min(len(selected_arns), self.ESTIMATED_PERMISSIONSETS_PER_ACCOUNT)
+
+    def _estimate_plans(self, account_ids, selected_arns, principals, principal_type):
+        pair_count = self._estimate_pair_count(account_ids, selected_arns)
+        if self.permissionsets:
+            estimates = {
+                'account-first': pair_count,
+                'permission-set-first': pair_count
+            }
+            describe_count = 0
+        else:
+            describe_count = min(len(selected_arns), pair_count)
+            estimates = {
+                'account-first': len(account_ids) + pair_count + describe_count,
+                'permission-set-first': 2 * len(selected_arns) + pair_count
+            }
+        principal_list_calls = 0
+        if principals is not None:
+            principal_count = len(principals)
+        elif self.identitystore_repository.get_bulk_loaded_principals(principal_type) is not None:
+            principal_count = len(self.identitystore_repository.get_bulk_loaded_principals(principal_type))
+        else:
+            principal_list_calls = self.identitystore_repository.get_bulk_load_pages(principal_type)
+            principal_count = None if principal_list_calls is None else sum(
+                self.identitystore_repository.principal_counts[listed_principal_type]
+                for listed_principal_type in (['USER', 'GROUP'] if principal_type == 'ALL' else [principal_type])
+                )
+        estimates['principal-first'] = None if principal_count is None else (
+            principal_list_calls + principal_count + min(describe_count, principal_count * self.ESTIMATED_PERMISSIONSETS_PER_ACCOUNT))
+        return dict(sorted(estimates.items(), key=lambda estimate: float('inf') if estimate[1] is None else estimate[1]))
+
+    def get_bindings_planned(self, account_ids, permission_set_arns=None, principals=None, principal_type='USER', max_workers=10, plan=None):
+        """Delivers the bindings of several accounts with the cheapest crawl plan of plan_crawl
+        
+        Parameters
+        -------
+        account_ids : list(string)
+        permission_set_arns : list(string)
+          Optional, only these permissionsets are crawled
+        principals : list(tuple)
+          Optional (principal_type, principal_id) pairs, only these principals are crawled
+        principal_type : string
+          Allowed values: 'USER', 'GROUP', 'ALL'. Ignored if principals are given
+        max_workers : int
+        plan : string
+          Optional, enforces one of CRAWL_PLANS instead of the cheapest one. principal-first bulk loads
+          the principals of principal_type if needed, its estimate is None if the identitystore size is unknown
+        
+        Returns
+        -------
+        bindings : dict
+          Shaped like the result of get_bindings_for_accounts, limited to permission_set_arns and principals
+        crawl_report : dict
+          Estimated and actual API calls of the crawl, without the ssoadmin:ListPermissionSets calls of the planning
+          and the name lookups of account-first and permission-set-first
+          {
+            'plan': 'account-first',
+            'estimated_calls': int,
+            'actual_calls': int,
+            'estimates': {'account-first': int, 'permission-set-first': int, 'principal-first': None}
+          }
+            
+        Raises
+        ------
+        SSOAdmin.Client.exceptions.ResourceNotFoundException
+        SSOAdmin.Client.exceptions.InternalServerException
+        SSOAdmin.Client.exceptions.ThrottlingException
+        SSOAdmin.Client.exceptions.ValidationException
+        SSOAdmin.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.ResourceNotFoundException
+        IdentityStore.Client.exceptions.ThrottlingException
+        IdentityStore.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.InternalServerException
+        IdentityStore.Client.exceptions.ValidationException
+        """
+        if principal_type not in ['USER','GROUP','ALL']:
+            raise ValueError(f'principal_type must be one of "USER", "GROUP" or "ALL". Provided value {principal_type}')
+        if plan is not None and plan not in self.CRAWL_PLANS:
+            raise ValueError(f'plan must be one of {", ".join(self.CRAWL_PLANS)}. Provided value {plan}')
+        selected_arns = self._select_permissionset_arns(permission_set_arns)
+        estimates = self._estimate_plans(account_ids, selected_arns, principals, principal_type)
+        if plan is None:
+            plan = next(iter(estimates))
+        logging.info(f'Crawling with plan {plan}, estimated API calls: {estimates}')
+        if plan != 'principal-first':
+            # Name lookups cost the same for every plan, the bulk load decision is made outside of the counted calls
+            self.identitystore_repository.prefetch_principals(self._estimate_pair_count(account_ids, selected_arns), principal_type)
+        calls_before_crawl = self._count_planned_calls()
+        if plan == 'principal-first' and principals is None:
+            # The principal listing is part of the principal-first plan
+            self.identitystore_repository.load_all_principals(principal_type)
+        if principals is not None:
+            principal_types = {principal[0] for principal in principals}
+            principal_type = principal_types.pop() if len(principal_types) == 1 else 'ALL'
+        if plan == 'principal-first':
+            bindings = self._crawl_principal_first(account_ids, selected_arns, principals, principal_type, max_workers)
+        else:
+            if plan == 'account-first':
+                crawl_units = self._get_crawl_units_account_first(account_ids, selected_arns, max_workers)
+            else:
+                crawl_units = self._get_crawl_units_permission_set_first(account_ids, selected_arns, max_workers)
+            bindings = self._to_bindings(
+                account_ids,
+                crawl_units,
+                self._crawl(crawl_units, principal_type, max_workers),
+                principal_filter=None if principals is None else set(principals)
+                )
+        crawl_report = {
+            'plan': plan,
+            'estimated_calls': estimates[plan],
+            'actual_calls': self._count_planned_calls() - calls_before_crawl,
+            'estimates': estimates
+        }
+        logging.info(f'Crawl plan {plan} estimated {crawl_report["estimated_calls"]} API calls, made {crawl_report["actual_calls"]}')
+        return bindings, crawl_report
+
+    def _count_planned_calls(self):
+        return self.metrics.count_api_calls(self.PLANNED_OPERATIONS)
+
+    def _get_crawl_units_account_first(self, account_ids, selected_arns, max_workers):
+        if self.permissionsets:
+            permission_set_arns_by_account_id = {
+                account_id: [permissionset['PermissionSetArn'] for permissionset in self.get_permissionsets_by_account_id(account_id)]
+                for account_id in account_ids
+                }
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                permission_set_arns_by_account_id = dict(zip(account_ids, executor.map(self._get_permissionset_arns_by_account_id, account_ids)))
+        selected_arn_positions = {permission_set_arn: position for position, permission_set_arn in enumerate(selected_arns)}
+        crawl_arns = [
+            (account_id, permission_set_arn)
+            for account_id in account_ids
+            for permission_set_arn in sorted(
+                (permission_set_arn for permission_set_arn in permission_set_arns_by_account_id[account_id] if permission_set_arn in selected_arn_positions),
+                key=selected_arn_positions.get
+                )
+            ]
+        self._describe_permissionsets({permission_set_arn for _, permission_set_arn in crawl_arns}, max_workers)
+        return [(account_id, self.permissionsets_by_arn[permission_set_arn]) for account_id, permission_set_arn in crawl_arns]
+
+    def _get_crawl_units_permission_set_first(self, account_ids, selected_arns, max_workers):
+        if self.permissionsets:
+            account_ids_by_permission_set_arn = {
+                permission_set_arn: self.permissionsets_by_arn[permission_set_arn]['AccountIds'] if permission_set_arn in self.permissionsets_by_arn else []
+                for permission_set_arn in selected_arns
+                }
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                account_ids_by_permission_set_arn = dict(zip(selected_arns, executor.map(self._get_account_ids_by_permissionset, selected_arns)))
+            self._describe_permissionsets(selected_arns, max_workers)
+        permission_set_arns_by_account_id = {account_id: [] for account_id in account_ids}
+        for permission_set_arn in selected_arns:
+            for account_id in account_ids_by_permission_set_arn[permission_set_arn]:
+                if account_id in permission_set_arns_by_account_id:
+                    permission_set_arns_by_account_id[account_id].append(permission_set_arn)
+        return [
+            (account_id, self.permissionsets_by_arn[permission_set_arn])
+            for account_id in account_ids
+            for permission_set_arn in permission_set_arns_by_account_id[account_id]
+            ]
+
+    def _crawl_principal_first(self, account_ids, selected_arns, principals, principal_type, max_workers):
+        if principals is None:
+            principals = self.identitystore_repository.get_bulk_loaded_principals(principal_type)
+        if principals is None:
+            raise ValueError('principal-first needs all principals in memory, raise max_cached_principals or choose another plan')
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            principal_account_assignments = list(executor.map(
+                lambda principal: self._get_account_assignments_by_principal(principal[1], principal[0]),
+                principals
+                ))
+        account_id_set = set(account_ids)
+        selected_arn_set = set(selected_arns)
+        # Assignments inherited through a group are reported with the group as principal, the group itself reports them
+        account_assignments = [
+            account_assignment
+            for (queried_principal_type, queried_principal_id), account_assignments_of_principal in zip(principals, principal_account_assignments)
+            for account_assignment in account_assignments_of_principal
+            if account_assignment['PrincipalType'] == queried_principal_type and account_assignment['PrincipalId'] == queried_principal_id
+                and account_assignment['AccountId'] in account_id_set and account_assignment['PermissionSetArn'] in selected_arn_set
+            ]
+        self._describe_permissionsets({account_assignment['PermissionSetArn'] for account_assignment in account_assignments}, max_workers)
+        principal_bindings = self._group_principal_assignments(account_assignments)
+        selected_arn_positions = {permission_set_arn: position for position, permission_set_arn in enumerate(selected_arns)}
+        return {
+            account_id: sorted(principal_bindings.get(account_id, []), key=lambda account_binding: selected_arn_positions[account_binding['permission_set_arn']])
+            for account_id in account_ids
+            }
+
+    def _describe_permissionsets(self, permission_set_arns, max_workers=10):
+        """Describes the permissionsets which are not in the local state yet"""
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(self._get_permissionset_name, permission_set_arns))
+
+    def _get_permissionset_arns_by_account_id(self, account_id: str):
+        """Retrieves the ARNs of all permissionsets provisioned to an account
+        
+        References
+        ----------
+        .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sso-admin/client/list_permission_sets_provisioned_to_account.html
+        """
+        logging.info(f'Calling ssoadmin:ListPermissionSetsProvisionedToAccount API to retrieve permissionsets of {account_id}')
+        # {
+        #     'NextToken': 'string',
+        #     'PermissionSets': [
+        #         'string',
+        #     ]
+        # }
+        permissionset_page_iterator = self._ssoadmin_client.get_paginator('list_permission_sets_provisioned_to_account').paginate(
+            InstanceArn=self.instance_arn,
+            AccountId=account_id,
+            MaxResults=100
+            )
+        return list(itertools.chain(
+            *[permissionset_page['PermissionSets'] for permissionset_page in permissionset_page_iterator]
+            ))
+
+    def _to_account_binding(self, permissionset, permissionset_bindings):
+        return {
+            'permission_set_arn': permissionset['PermissionSetArn'],
+            'permission_set_name': permissionset['Name'],
+            'attached_users': permissionset_bindings
+            }
+
+    def refresh_bindings(self, account_ids, previous_permissionsets, previous_bindings, since=None, principal_type='USER', max_workers=10):
+        """Refreshes the result of a previous get_bindings_for_accounts run and only crawls stale account/permissionset pairs
+        
+        A pair is stale if its account was not part of the previous run, the permissionset is new, its metadata changed, it got
+        provisioned to the account since the previous run or, if since is given, an account assignment creation or deletion
+        request targeted the pair after that point in time.
+        All other pairs reuse their previous bindings. Assignment changes are only detected through the request history,
+        so pass since whenever possible.
+        
+        Parameters
+        -------
+        account_ids : list(string)
+        previous_permissionsets : list(dict)
+          Result of load_all_permissionsets of the previous run
+        previous_bindings : dict
+          Result of get_bindings_for_accounts of the previous run
+        since : datetime
+          Optional timezone aware start time of the previous run
+        principal_type : string
+          Allowed values: 'USER', 'GROUP', 'ALL'. Must match the previous run
+        max_workers : int
+        
+        Returns
+        -------
+        bindings : dict
+          Shaped like the result of get_bindings_for_accounts
+        diff : dict
+          {
+            'added': [{
+              'account_id':'string',
+              'permission_set_arn':'string',
+              'permission_set_name':'string',
+              'PrincipalType':'USER',
+              'Id':'string',
+              'Name':'string'
+            }],
+            'removed': [...]
+          }
+            
+        Raises
+        ------
+        SSOAdmin.Client.exceptions.ResourceNotFoundException
+        SSOAdmin.Client.exceptions.InternalServerException
+        SSOAdmin.Client.exceptions.ThrottlingException
+        SSOAdmin.Client.exceptions.ValidationException
+        SSOAdmin.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.ResourceNotFoundException
+        IdentityStore.Client.exceptions.ThrottlingException
+        IdentityStore.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.InternalServerException
+        IdentityStore.Client.exceptions.ValidationException
+        """
+        previous_permissionsets_by_arn = {permissionset['PermissionSetArn']: permissionset for permissionset in previous_permissionsets}
+        self.load_all_permissionsets(use_snapshot=False, max_workers=max_workers)
+        changed_pairs = self._get_changed_assignment_pairs(since) if since else set()
+
+        stale_units = []
+        for account_id in account_ids:
+            for permissionset in self.get_permissionsets_by_account_id(account_id):
+                permission_set_arn = permissionset['PermissionSetArn']
+                previous_permissionset = previous_permissionsets_by_arn.get(permission_set_arn)
+                if (account_id not in previous_bindings
+                        or previous_permissionset is None
+                        or account_id not in previous_permissionset['AccountIds']
+                        or (account_id, permission_set_arn) in changed_pairs
+                        or any(str(permissionset.get(key)) != str(previous_permissionset.get(key)) for key in self.PERMISSIONSET_METADATA_KEYS)):
+                    stale_units.append((account_id, permissionset))
+        logging.info(f'Refreshing {len(stale_units)} stale account/permissionset pairs')
+        stale_bindings = dict(zip(
+            [(account_id, permissionset['PermissionSetArn']) for account_id, permissionset in stale_units],
+            self._crawl(stale_units, principal_type, max_workers, use_snapshot=False)
+            ))
+
+        bindings = {account_id: [] for account_id in account_ids}
+        for account_id in account_ids:
+            previous_account_bindings = {
+                account_binding['permission_set_arn']: account_binding
+                for account_binding in previous_bindings.get(account_id, [])
+                }
+            for permissionset in self.get_permissionsets_by_account_id(account_id):
+                permission_set_arn = permissionset['PermissionSetArn']
+                if (account_id, permission_set_arn) in stale_bindings:
+                    permissionset_bindings = stale_bindings[(account_id, permission_set_arn)]
+                    if permissionset_bindings:
+                        bindings[account_id].append(self._to_account_binding(permissionset, permissionset_bindings))
+                elif permission_set_arn in previous_account_bindings:
+                    bindings[account_id].append(previous_account_bindings[permission_set_arn])
+        return bindings, self.diff_bindings(previous_bindings, bindings)
+
+    def _get_changed_assignment_pairs(self, since):
+        """Retrieves all (account_id, permission_set_arn) pairs targeted by assignment creation or deletion requests after since
+        
+        Returns
+        -------
+        changed_pairs : set(tuple(string, string))
+            
+        Raises
+        ------
+        SSOAdmin.Client.exceptions.ResourceNotFoundException
+        SSOAdmin.Client.exceptions.InternalServerException
+        SSOAdmin.Client.exceptions.ThrottlingException
+        SSOAdmin.Client.exceptions.ValidationException
+        SSOAdmin.Client.exceptions.AccessDeniedException
+        
+        
+        References
+        ----------
+        .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sso-admin/client/list_account_assignment_creation_status.html
+        .. [2] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sso-admin/client/describe_account_assignment_creation_status.html
+        .. [3] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sso-admin/client/list_account_assignment_deletion_status.html
+        .. [4] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sso-admin/client/describe_account_assignment_deletion_status.html
+        """
+        changed_pairs = set()
+        for operation, describe_operation, request_id_parameter, status_key in [
+                ('list_account_assignment_creation_status', 'describe_account_assignment_creation_status', 'AccountAssignmentCreationRequestId', 'AccountAssignmentCreationStatus'),
+                ('list_account_assignment_deletion_status', 'describe_account_assignment_deletion_status', 'AccountAssignmentDeletionRequestId', 'AccountAssignmentDeletionStatus')
+                ]:
+            logging.info(f'Calling ssoadmin:{operation} API to retrieve assignment requests since {since}')
+            # {
+            #     'AccountAssignmentsCreationStatus': [
+            #         {
+            #             'Status': 'IN_PROGRESS'|'FAILED'|'SUCCEEDED',
+            #             'RequestId': 'string',
+            #             'CreatedDate': datetime(2015, 1, 1)
+            #         },
+            #     ],
+            #     'NextToken': 'string'
+            # }
+            status_page_iterator = self._ssoadmin_client.get_paginator(operation).paginate(InstanceArn=self.instance_arn, MaxResults=100)
+            for status_page in status_page_iterator:
+                status_items = status_page.get('AccountAssignmentsCreationStatus', status_page.get('AccountAssignmentsDeletionStatus', []))
+                for status_item in status_items:
+                    if status_item['Status'] == 'FAILED' or status_item['CreatedDate'] < since:
+                        continue
+                    logging.info(f'Calling ssoadmin:{describe_operation} API for request {status_item["RequestId"]}')
+                    request_status = getattr(self._ssoadmin_client, describe_operation)(
+                        InstanceArn=self.instance_arn,
+                        **{request_id_parameter: status_item['RequestId']}
+                        )[status_key]
+                    changed_pairs.add((request_status['TargetId'], request_status['PermissionSetArn']))
+        return changed_pairs
+
+    @staticmethod
+    def diff_bindings(previous_bindings, bindings):
+        """Compares two results of get_bindings_for_accounts on the level of single principal bindings
+        
+        Returns
+        -------
+        diff : dict
+          {
+            'added': [{
+              'account_id':'string',
+              'permission_set_arn':'string',
+              'permission_set_name':'string',
+              'PrincipalType':'USER',
+              'Id':'string',
+              'Name':'string'
+            }],
+            'removed': [...]
+          }
+        """
+        def flatten(account_bindings_by_account_id):
+            return {
+                (account_id, account_binding['permission_set_arn'], principal['PrincipalType'], principal['Id']): {
+                    'account_id': account_id,
+                    'permission_set_arn': account_binding['permission_set_arn'],
+                    'permission_set_name': account_binding['permission_set_name'],
+                    **principal
+                    }
+                for account_id, account_bindings in account_bindings_by_account_id.items()
+                for account_binding in account_bindings
+                for principal in account_binding['attached_users']
+                }
+        previous_records = flatten(previous_bindings)
+        records = flatten(bindings)
+        return {
+            'added': [record for key, record in records.items() if key not in previous_records],
+            'removed': [record for key, record in previous_records.items() if key not in records]
+            }
+
+    def iter_bindings(self, accounts, principal_type='USER', max_workers=10, organization_wide=False):
+        """Streams one flat record per (account, permissionset, principal) as soon as it is resolved
+        
+        At most 2 * max_workers account/permissionset pairs are in flight, memory therefore stays flat
+        independent of the organization size. Records keep the order of accounts and permissionsets, the
+        crawl therefore only starts once all permissionsets are loaded.
+        
+        Parameters
+        -------
+        accounts : iterable(dict)
+          Shaped like the result of AccountRepository.get_all_accounts
+        principal_type : string
+          Allowed values: 'USER', 'GROUP', 'ALL'
+        max_workers : int
+        organization_wide : bool
+          Whether lazily loaded accounts are the whole organization. Their provisioned pairs then decide on bulk loading
+          principal names, the names of any other lazily loaded scope are resolved on demand
+        
+        Yields
+        -------
+        record : dict
+          {
+            'account_id':'string',
+            'account_name':'string',
+            'permission_set_arn':'string',
+            'permission_set_name':'string',
+            'PrincipalType':'USER',
+            'Id':'string',
+            'Name':'string'
+          }
+            
+        Raises
+        ------
+        SSOAdmin.Client.exceptions.ResourceNotFoundException
+        SSOAdmin.Client.exceptions.InternalServerException
+        SSOAdmin.Client.exceptions.ThrottlingException
+        SSOAdmin.Client.exceptions.ValidationException
+        SSOAdmin.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.ResourceNotFoundException
+        IdentityStore.Client.exceptions.ThrottlingException
+        IdentityStore.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.InternalServerException
+        IdentityStore.Client.exceptions.ValidationException
+        """
+        # Like in get_bindings_for_accounts the pair count stands in for the distinct principals
+        if isinstance(accounts, (list, tuple)):
+            self.identitystore_repository.prefetch_principals(self._count_pending_pairs([
+                (account['Id'], permissionset['PermissionSetArn'])
+                for account in accounts
+                for permissionset in self.get_permissionsets_by_account_id(account['Id'])
+                ], principal_type), principal_type)
+        elif organization_wide:
+            self._ensure_permissionsets_loaded()
+            self.identitystore_repository.prefetch_principals(self._count_pending_pairs([
+                (account_id, permissionset['PermissionSetArn'])
+                for permissionset in self.permissionsets
+                for account_id in permissionset['AccountIds']
+                ], principal_type), principal_type)
+        else:
+            # A lazily loaded scope is only known once crawled, all provisioned pairs would overestimate a small scope
+            logging.info('Resolving the principals of lazily loaded accounts on demand')
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for account in accounts:
+                for permissionset in self.get_permissionsets_by_account_id(account['Id']):
+                    in_flight.append((account, permissionset, executor.submit(
+                        self._get_bindings_by_permissionset, account['Id'], permissionset['PermissionSetArn'], principal_type
+                        )))
+                    while len(in_flight) >= 2 * max_workers:
+                        yield from self._to_records(*in_flight.popleft())
+            while in_flight:
+                yield from self._to_records(*in_flight.popleft())
+
+    def _to_records(self, account, permissionset, crawl_future):
+        for principal in crawl_future.result():
+            yield {
+                'account_id': account['Id'],
+                'account_name': account['Name'],
+                'permission_set_arn': permissionset['PermissionSetArn'],
+                'permission_set_name': permissionset['Name'],
+                **principal
+                }
+
+    def build_assignment_graph(self, accounts, principal_type='USER', max_workers=10):
+        """Crawls accounts like iter_bindings into a compact AssignmentGraph
+        
+        Only the interned graph is kept in memory, dict shaped bindings are created again
+        by the graph when its result is written.
+        
+        Parameters
+        -------
+        accounts : iterable(dict)
+          Shaped like the result of AccountRepository.get_all_accounts
+        principal_type : string
+          Allowed values: 'USER', 'GROUP', 'ALL'
+        max_workers : int
+        
+        Returns
+        -------
+        assignment_graph : AssignmentGraph
+          Contains every account, including accounts without bindings
+        """
+        assignment_graph = AssignmentGraph()
+        accounts = list(accounts)
+        for account in accounts:
+            assignment_graph.add_account(account['Id'], account['Name'])
+        for record in self.iter_bindings(accounts, principal_type=principal_type, max_workers=max_workers):
+            assignment_graph.add_record(record)
+        assignment_graph.compact()
+        return assignment_graph
+
+    def get_bindings_by_principal(self, principal_id: str, principal_type='USER'):
+        """Delivers all accounts and permissionsets a single user or group is assigned to, without crawling all accounts
+        
+        Assignments a user inherits through a group are reported with the group as principal.
+        Only the permissionsets found are described if the permissionsets are not loaded yet.
+        
+        Parameters
+        -------
+        principal_id : string
+        principal_type : string
+          Allowed values: 'USER', 'GROUP'
+        
+        Returns
+        -------
+        bindings : dict
+          Shaped like the result of get_bindings_for_accounts
+          {
+            'string': [{
+              'permission_set_arn':'string',
+              'permission_set_name':'string',
+              'attached_users': [{
+                'PrincipalType':'USER', 
+                'Id':'string',
+                'Name':'string'
+              }]
+            }]
+          }
+            
+        Raises
+        ------
+        SSOAdmin.Client.exceptions.ResourceNotFoundException
+        SSOAdmin.Client.exceptions.InternalServerException
+        SSOAdmin.Client.exceptions.ThrottlingException
+        SSOAdmin.Client.exceptions.ValidationException
+        SSOAdmin.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.ResourceNotFoundException
+        IdentityStore.Client.exceptions.ThrottlingException
+        IdentityStore.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.InternalServerException
+        IdentityStore.Client.exceptions.ValidationException
+        
+        References
+        ----------
+        .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sso-admin/client/list_account_assignments_for_principal.html
+        """
+        if principal_type not in ['USER','GROUP']:
+            raise ValueError(f'principal_type must be one of "USER" or "GROUP". Provided value {principal_type}')
+        return self._group_principal_assignments(self._get_account_assignments_by_principal(principal_id, principal_type))
+
+    def _get_account_assignments_by_principal(self, principal_id: str, principal_type: str):
+        logging.info(f'Calling ssoadmin:ListAccountAssignmentsForPrincipal API to retrieve account assignments of {principal_type} {principal_id}')
+        # {
+        #     'AccountAssignments': [
+        #         {
+        #             'AccountId': 'string',
+        #             'PermissionSetArn': 'string',
+        #             'PrincipalId': 'string',
+        #             'PrincipalType': 'USER'|'GROUP'
+        #         },
+        #     ],
+        #     'NextToken': 'string'
+        # }
+        assignment_page_iterator = self._ssoadmin_client.get_paginator('list_account_assignments_for_principal').paginate(
+            InstanceArn=self.instance_arn,
+            PrincipalId=principal_id,
+            PrincipalType=principal_type,
+            MaxResults=100
+            )
+        return list(itertools.chain(
+            *[assignment_page['AccountAssignments'] for assignment_page in assignment_page_iterator]
+            ))
+
+    def _group_principal_assignments(self, account_assignments):
+        """Groups raw account assignments into bindings shaped like the result of get_bindings_for_accounts, ordered by account id"""
+        bindings = {}
+        for (account_id, permission_set_arn), grouped_account_assignments in itertools.groupby(
+                sorted(account_assignments, key=lambda account_assignment: (account_assignment['AccountId'], account_assignment['PermissionSetArn'])),
+                key=lambda account_assignment: (account_assignment['AccountId'], account_assignment['PermissionSetArn'])):
+            bindings.setdefault(account_id, []).append({
+                'permission_set_arn': permission_set_arn,
+                'permission_set_name': self._get_permissionset_name(permission_set_arn),
+                'attached_users': self._classify_account_assignments(grouped_account_assignments)
+                })
+        return bindings
+
+    def _get_permissionset_name(self, permission_set_arn: str):
+        """Returns the name of a permissionset from the local state and only describes permissionsets which are not loaded"""
+        with self._permissionset_lock:    # Describes every permissionset once, also while crawl threads ask for the same one
+            if permission_set_arn not in self.permissionsets_by_arn:
+                logging.info(f'Calling ssoadmin:DescribePermissionSet API to retrieve the name of permissionset {permission_set_arn}')
+                self.permissionsets_by_arn[permission_set_arn] = self._ssoadmin_client.describe_permission_set(
+                    InstanceArn=self.instance_arn,
+                    PermissionSetArn=permission_set_arn
+                    ).get('PermissionSet')
+        return self.permissionsets_by_arn[permission_set_arn]['Name']
+
+    def expand_effective_access(self, account_bindings, max_workers=10):
+        """Expands GROUP bindings into the users behind them
+        
+        Every group is resolved with one paged identitystore:ListGroupMemberships pass, no matter how many
+        bindings reference it. Users reachable directly and through one or more groups are reported once,
+        AccessVia lists every path as 'DIRECT' or the group name.
+        
+        Parameters
+        -------
+        account_bindings : dict
+          Result of get_bindings_for_accounts with principal_type 'ALL'
+        max_workers : int
+          Upper bound of concurrent group membership lookups
+        
+        Returns
+        -------
+        bindings : dict
+          Shaped like account_bindings, attached_users only contains users
+          {
+            'string': [{
+              'permission_set_arn':'string',
+              'permission_set_name':'string',
+              'attached_users': [{
+                'PrincipalType':'USER', 
+                'Id':'string',
+                'Name':'string',
+                'AccessVia': ['DIRECT', 'string']
+              }]
+            }]
+          }
+            
+        Raises
+        ------
+        IdentityStore.Client.exceptions.ResourceNotFoundException
+        IdentityStore.Client.exceptions.ThrottlingException
+        IdentityStore.Client.exceptions.AccessDeniedException
+        IdentityStore.Client.exceptions.InternalServerException
+        IdentityStore.Client.exceptions.ValidationException
+        
+        References
+        ----------
+        .. [1] https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/identitystore/client/list_group_memberships.html
+        """
+        group_ids = list(dict.fromkeys(
+            principal['Id']
+            for account_bindings_of_account in account_bindings.values()
+            for account_binding in account_bindings_of_account
+            for principal in account_binding['attached_users'] if principal['PrincipalType'] == 'GROUP' and not principal.get('Orphaned')
+            ))
+        logging.info(f'Resolving the memberships of {len(group_ids)} groups')
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            member_ids_by_group_id = dict(zip(group_ids, executor.map(self.identitystore_repository.get_member_ids_by_group_id, group_ids)))
+        member_ids = set(itertools.chain(*member_ids_by_group_id.values()))
+        self.identitystore_repository.prefetch_principals(len(member_ids), 'USER')
+
+        effective_bindings = {}
+        for account_id, account_bindings_of_account in account_bindings.items():
+            effective_bindings[account_id] = []
+            for account_binding in account_bindings_of_account:
+                effective_users = {}
+                for principal in account_binding['attached_users']:
+                    if principal['PrincipalType'] == 'USER':
+                        user_ids, access_via = [principal['Id']], 'DIRECT'
+                    else:
+                        user_ids, access_via = member_ids_by_group_id.get(principal['Id'], []), principal['Name']    # Orphaned groups have no members
+                    for user_id in user_ids:
+                        effective_users.setdefault(user_id, {
+                            **self._to_binding('USER', user_id, self.identitystore_repository.get_username_by_id(user_id)),
+                            'AccessVia': []
+                            })['AccessVia'].append(access_via)
+                if effective_users:
+                    effective_bindings[account_id].append({
+                        **account_binding,
+                        'attached_users': list(effective_users.values())
+                        })
+        return effective_bindings
@@ -0,0 +1,221 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from repository.assignment_graph import AssignmentGraph
+
+class AssignmentIndex:
+    def __init__(self, assignment_graph: AssignmentGraph):
+        """Lookup index of the bindings of an AssignmentGraph by account, permissionset and principal
+
+        Permissionsets can be looked up by ARN or name, principals by id or name.
+        """
+        self.assignment_graph = assignment_graph
+        self.binding_indexes_by_account = {}
+        self.binding_indexes_by_permission_set = {}
+        self.binding_indexes_by_principal = {}
+        for binding_index, (account_key, permission_set_key, principal_key) in enumerate(zip(
+                assignment_graph.binding_accounts, assignment_graph.binding_permission_sets, assignment_graph.binding_principals)):
+            self.binding_indexes_by_account.setdefault(assignment_graph.account_ids[account_key], []).append(binding_index)
+            for permission_set in {assignment_graph.permission_set_arns[permission_set_key], assignment_graph.permission_set_names[permission_set_key]}:
+                self.binding_indexes_by_permission_set.setdefault(permission_set, []).append(binding_index)
+            for principal in {assignment_graph.principal_ids[principal_key], assignment_graph.principal_names[principal_key]} - {None}:    # Orphaned principals have no name
+                self.binding_indexes_by_principal.setdefault(principal, []).append(binding_index)
+
+    def find_records(self, account_id=None, permission_set=None, principal=None):
+        """Returns the records matching all given criteria, all records without criteria"""
+        candidates = [
+            binding_indexes.get(value, [])
+            for binding_indexes, value in [
+                (self.binding_indexes_by_account, account_id),
+                (self.binding_indexes_by_permission_set, permission_set),
+                (self.binding_indexes_by_principal, principal)
+            ]
+            if value is not None
+        ]
+        if not candidates:
+            binding_indexes = range(len(self.assignment_graph))
+        else:
+            candidates.sort(key=len)
+            binding_indexes = set(candidates[0]).intersection(*candidates[1:])
+        return [self.assignment_graph.get_record(binding_index) for binding_index in sorted(binding_indexes)]
+
+class AssignmentService:
+    def __init__(self, repository_factory, principal_type='USER', max_workers=10, refresh_interval=900, full_refresh_interval=24 * 3600,
+                 account_loader=None):
+        """Keeps the bindings of the organization in memory and refreshes them in the background
+
+        Refreshes between full refreshes only re-crawl stale account/permissionset pairs with
+        SsoAdminRepository.refresh_bindings. A full refresh starts over with new repositories, so
+        renamed principals and assignment changes missing from the request history are picked up.
+
+        repository_factory: Callable returning a new (SsoAdminRepository, AccountRepository) pair, called by every full
+          refresh. It should reuse clients and snapshot across calls, the previous repositories are not closed
+        account_loader: Optional callable returning the list of accounts in scope from an AccountRepository,
+          the whole organization by default. Called again by every refresh
+        Example:
+            assignment_service = AssignmentService(
+                lambda: create_repositories(arguments, metrics, client_factory=client_factory, snapshot_repository=snapshot_repository),
+                refresh_interval=600
+            )
+            assignment_service.refresh()
+            assignment_service.start()
+            serve(assignment_service, '127.0.0.1', 8080)
+        """
+        self._repository_factory = repository_factory
+        self._account_loader = account_loader or (lambda account_repository: account_repository.get_all_accounts())
+        self.principal_type = principal_type
+        self.max_workers = max_workers
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.assignment_index = None
+        self.refreshed_at = None
+        self.last_refresh_seconds = None
+        self.last_refresh_error = None
+        self._full_refreshed_at = None
+        self._permissionsets = None
+        self._ssoadmin_repository = None
+        self._account_repository = None
+        self._refresh_lock = threading.Lock()    # Only one refresh at a time, lookups never wait for it
+        self._stopped = threading.Event()
+
+    def refresh(self):
+        """Builds a new index and swaps it in once it is complete"""
+        with self._refresh_lock:
+            started_at = datetime.now(timezone.utc)
+            refresh_started_at = time.perf_counter()
+            full_refresh = (self.assignment_index is None
+                            or (started_at - self._full_refreshed_at).total_seconds() >= self.full_refresh_interval)
+            if full_refresh:
+                self._ssoadmin_repository, self._account_repository = self._repository_factory()
+                accounts = self._account_loader(self._account_repository)
+                # Crawls the accounts of every permissionset as soon as it is loaded
+                account_bindings = self._ssoadmin_repository.get_bindings_for_accounts(
+                    [account['Id'] for account in accounts],
+                    max_workers=self.max_workers,
+                    principal_type=self.principal_type
+                )
+            else:
+                self._account_repository.forget_accounts()
+                accounts = self._account_loader(self._account_repository)
+                account_bindings, bindings_diff = self._ssoadmin_repository.refresh_bindings(
+                    [account['Id'] for account in accounts],
+                    self._permissionsets,
+                    self.assignment_index.assignment_graph.to_account_bindings(),
+                    since=self.refreshed_at,
+                    principal_type=self.principal_type,
+                    max_workers=self.max_workers
+                )
+                logging.info(f'Refresh added {len(bindings_diff["added"])} and removed {len(bindings_diff["removed"])} bindings')
+            self.assignment_index = AssignmentIndex(AssignmentGraph.from_account_bindings(accounts, account_bindings))
+            self._permissionsets = self._ssoadmin_repository.permissionsets
+            self.refreshed_at = started_at
+            if full_refresh:
+                self._full_refreshed_at = started_at
+            self.last_refresh_seconds = round(time.perf_counter() - refresh_started_at, 3)
+            self.last_refresh_error = None
+
+    def _refresh_periodically(self):
+        while not self._stopped.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as error:    # Keeps serving the previous index, the error is reported with every response
+                logging.exception('Background refresh failed')
+                self.last_refresh_error = repr(error)
+
+    def start(self):
+        threading.Thread(target=self._refresh_periodically, name='assignment-refresh', daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def get_freshness(self):
+        """
+        Returns
+        -------
+        freshness : dict
+          {
+            'refreshed_at': 'string',
+            'age_seconds': float,
+            'refresh_interval_seconds': int,
+            'last_refresh_seconds': float,
+            'last_refresh_error': None
+          }
+        """
+        return {
+            'refreshed_at': self.refreshed_at.isoformat() if self.refreshed_at else None,
+            'age_seconds': round((datetime.now(timezone.utc) - self.refreshed_at).total_seconds(), 3) if self.refreshed_at else None,
+            'refresh_interval_seconds': self.refresh_interval,
+            'last_refresh_seconds': self.last_refresh_seconds,
+            'last_refresh_error': self.last_refresh_error
+        }
+
+def create_request_handler(assignment_service: AssignmentService, metrics=None):
+    """Request handler serving JSON lookups of the current index
+
+    GET /bindings?account_id=ID&permission_set=ARN_OR_NAME&principal=ID_OR_NAME
+      {'freshness': {...}, 'records': [...]}, all criteria are optional and combined
+    GET /status
+      {'freshness': {...}, 'accounts': int, 'permission_sets': int, 'principals': int, 'bindings': int}
+    GET /metrics
+      Prometheus text of the optional Metrics
+    """
+    class AssignmentRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            request_url = urlparse(self.path)
+            if request_url.path == '/metrics' and metrics is not None:
+                return self._send(200, metrics.to_prometheus(), 'text/plain; version=0.0.4')
+            assignment_index = assignment_service.assignment_index    # Stays consistent while a refresh swaps the index
+            if request_url.path not in ['/bindings', '/status']:
+                return self._send_json(404, {'error': f'Unknown path {request_url.path}'})
+            if assignment_index is None:
+                return self._send_json(503, {'error': 'Index is not built yet', 'freshness': assignment_service.get_freshness()})
+            if request_url.path == '/status':
+                assignment_graph = assignment_index.assignment_graph
+                return self._send_json(200, {
+                    'freshness': assignment_service.get_freshness(),
+                    'accounts': len(assignment_graph.account_ids),
+                    'permission_sets': len(assignment_graph.permission_set_arns),
+                    'principals': len(assignment_graph.principal_ids),
+                    'bindings': len(assignment_graph)
+                })
+            query = {key: values[0] for key, values in parse_qs(request_url.query).items()}
+            self._send_json(200, {
+                'freshness': assignment_service.get_freshness(),
+                'records': assignment_index.find_records(
+                    account_id=query.get('account_id'),
+                    permission_set=query.get('permission_set'),
+                    principal=query.get('principal')
+                )
+            })
+
+        def _send_json(self, status: int, payload):
+            self._send(status, json.dumps(payload), 'application/json')
+
+        def _send(self, status: int, body: str, content_type: str):
+            encoded_body = body.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(encoded_body)))
+            self.end_headers()
+            self.wfile.write(encoded_body)
+
+        def log_message(self, format, *args):
+            logging.info(f'{self.address_string()} {format % args}')
+
+    return AssignmentRequestHandler
+
+def serve(assignment_service: AssignmentService, host: str, port: int, metrics=None):
+    """Serves lookups until interrupted"""
+    http_server = ThreadingHTTPServer((host, port), create_request_handler(assignment_service, metrics))
+    logging.warning(f'Serving assignment lookups on http://{host}:{port}')
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        assignment_service.stop()
+        http_server.server_close()
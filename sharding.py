@@ -0,0 +1,57 @@
+import json
+import zlib
+
+def parse_shard(shard: str):
+    """Parses 'i/N' into (i, N) with 1 <= i <= N"""
+    shard_index, _, shard_count = shard.partition('/')
+    if not (shard_index.isdigit() and shard_count.isdigit()) or not 1 <= int(shard_index) <= int(shard_count):
+        raise ValueError(f'shard must look like i/N with 1 <= i <= N. Provided value {shard}')
+    return int(shard_index), int(shard_count)
+
+def get_shard_index(account_id: str, shard_count: int) -> int:
+    """Stable across processes and hosts, unlike hash() which is salted per interpreter"""
+    return zlib.crc32(account_id.encode()) % shard_count + 1
+
+def shard_accounts(accounts, shard_index: int, shard_count: int):
+    return [account for account in accounts if get_shard_index(account['Id'], shard_count) == shard_index]
+
+def write_partial_result(path: str, shard: str, accounts, account_bindings, identitystore_repository):
+    """Writes the result of one shard together with the principal names it resolved
+
+    Partial result:
+      {
+        'shards': ['i/N'],
+        'accounts': [{'Id': 'string', 'Name': 'string'}],
+        'bindings': {'string': [...]},
+        'user_names': {'string': 'string'},
+        'group_names': {'string': 'string'}
+      }
+    """
+    with open(path, 'w') as partial_result_file:
+        json.dump({
+            'shards': [shard],
+            'accounts': accounts,
+            'bindings': account_bindings,
+            'user_names': identitystore_repository.user_repository,
+            'group_names': identitystore_repository.group_repository
+        }, partial_result_file, default=str)
+
+def merge_partial_results(paths):
+    """Merges partial results into one, shaped like a single partial result
+
+    Accounts crawled by several shards are kept once, principal names are deduplicated across shards.
+    Accounts are ordered by id since shards are crawled independently.
+    """
+    merged_result = {'shards': [], 'accounts': [], 'bindings': {}, 'user_names': {}, 'group_names': {}}
+    for path in paths:
+        with open(path) as partial_result_file:
+            partial_result = json.load(partial_result_file)
+        merged_result['shards'].extend(partial_result['shards'])
+        for account in partial_result['accounts']:
+            if account['Id'] not in merged_result['bindings']:
+                merged_result['accounts'].append(account)
+                merged_result['bindings'][account['Id']] = partial_result['bindings'].get(account['Id'], [])
+        merged_result['user_names'].update(partial_result['user_names'])
+        merged_result['group_names'].update(partial_result['group_names'])
+    merged_result['accounts'].sort(key=lambda account: account['Id'])
+    return merged_result
@@ -0,0 +1,71 @@
+import csv
+import itertools
+import json
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:    # Only needed for the parquet and arrow formats
+    pyarrow = None
+
+RECORD_FIELDS = ['account_id', 'account_name', 'permission_set_arn', 'permission_set_name', 'PrincipalType', 'Id', 'Name', 'AccessVia', 'Orphaned']
+# Records per row group of the columnar formats, bounds their memory independent of the organization size
+RECORD_BATCH_SIZE = 10000
+
+def write_ndjson(records, stream):
+    """Writes one JSON object per line and flushes after every record so consumers can start right away"""
+    for record in records:
+        stream.write(json.dumps(record, default=str) + '\n')
+        stream.flush()
+
+def write_csv(records, stream, fields=RECORD_FIELDS):
+    """Writes a header line followed by one row per record and flushes after every record. Lists are joined with ';'"""
+    csv_writer = csv.DictWriter(stream, fieldnames=fields, extrasaction='ignore')
+    csv_writer.writeheader()
+    for record in records:
+        csv_writer.writerow({key: ';'.join(value) if isinstance(value, list) else value for key, value in record.items()})
+        stream.flush()
+
+def _get_record_schema():
+    if pyarrow is None:
+        raise ImportError('The parquet and arrow formats need pyarrow, install it with: pip install pyarrow')
+    return pyarrow.schema(
+        [(field, pyarrow.string()) for field in RECORD_FIELDS if field not in ['AccessVia', 'Orphaned']] +
+        [('AccessVia', pyarrow.list_(pyarrow.string())), ('Orphaned', pyarrow.bool_())]
+    )
+
+def _iter_record_batches(records, schema):
+    """Transposes records into column batches of RECORD_BATCH_SIZE records. Missing fields become nulls"""
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, RECORD_BATCH_SIZE))
+        if not batch:
+            return
+        yield pyarrow.RecordBatch.from_pydict(
+            {field: [record.get(field) for record in batch] for field in schema.names},
+            schema=schema
+        )
+
+def write_parquet(records, stream):
+    """Writes one Parquet row group per RECORD_BATCH_SIZE records to a binary stream"""
+    schema = _get_record_schema()
+    with pyarrow.parquet.ParquetWriter(stream, schema) as parquet_writer:
+        for record_batch in _iter_record_batches(records, schema):
+            parquet_writer.write_batch(record_batch)
+
+def write_arrow(records, stream):
+    """Writes an Arrow IPC file (Feather V2) with one record batch per RECORD_BATCH_SIZE records to a binary stream"""
+    schema = _get_record_schema()
+    with pyarrow.ipc.new_file(stream, schema) as arrow_writer:
+        for record_batch in _iter_record_batches(records, schema):
+            arrow_writer.write_batch(record_batch)
+
+RECORD_WRITERS = {
+    'ndjson': write_ndjson,
+    'csv': write_csv,
+    'parquet': write_parquet,
+    'arrow': write_arrow
+}
+# Formats written to a binary file instead of a text stream
+BINARY_FORMATS = ['parquet', 'arrow']